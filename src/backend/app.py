@@ -1,48 +1,158 @@
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Header, HTTPException, WebSocket
+from fastapi.responses import FileResponse, StreamingResponse
 
-from langchain_core.messages import HumanMessage
-from langchain_core.runnables import RunnableConfig
+import asyncio
+import json
 
-from schemas import ExtractData, UserData
+from schemas import UserData, SpreadImageRequest, ProfileData
 from graph import *
+from graph.agents.hedge import hedge_stats
+from graph.breaker import breaker_stats
+from graph.tiers import load
+from graph.warmup import warmup
+from graph.charts import charts, chart_args, profile_version
+from graph.compaction import compactor
+from graph.agents.tools import tool_cache
+from runs import RunFailed, RunRegistry
+from ws import ChatSession
+from jobs import create_broker
+from worker import GraphWorker, run_workflow, submit_job
+from assets import SIZES, AssetStore, card_slugs
+from spreads import SpreadStore
+import settings
 
 
-async def stream_agent(item: UserData):
-    config = RunnableConfig(
-        configurable={
-            "thread_id": item.user_id
-        }
-    )
-    
-    info = {
-        'messages': [HumanMessage(item.message)], 
-        'next_node': 'router_node', 
-        'birth_day': item.birth_day, 
-        'city': item.city, 
-        'country': item.city, 
-        'time_birth': item.time_birth, 
-        'name': item.name
-    }
-    
-    async for chunk in workflow.astream(input=info,
-                                 stream_mode='values', config=config):
-        if chunk.get('taro_cards'):
-            chunk['taro_cards'] = [card.model_dump() for card in chunk.get('taro_cards')]
-            
-        info = ExtractData.model_validate(chunk)
-        yield info.model_dump_json()
+runs = RunRegistry()
+# Очередь нужна только в режиме queue: в inline BROKER_URL не трогаем, и redis не импортируется
+broker = create_broker(settings.broker_url) if settings.graph_mode == 'queue' else None
+assets = AssetStore(settings.assets_dir)
+spreads = SpreadStore(settings.spreads_dir, settings.spreads_cache_bytes, settings.spread_workers, assets)
+
+# Имя файла содержит хеш содержимого — браузер может не перепроверять его никогда
+IMMUTABLE = {'Cache-Control': 'public, max-age=31536000, immutable'}
+
+
+def stream_agent(item: UserData):
+    if settings.graph_mode == 'queue':
+        return submit_job(broker, item)
+    return run_workflow(workflow, item)
+
+
+async def follow_run(run, cursor: int = 0):
+    try:
+        async for seq, data in run.subscribe(cursor):
+            # NDJSON: кадр на строку, клиент не зависит от того, как транспорт режет поток
+            yield data.model_copy(update={'seq': seq, 'run_id': run.run_id}).model_dump_json() + '\n'
+    except RunFailed as e:
+        # Статус 200 уже ушёл — о сбое говорит последний кадр
+        yield json.dumps({'run_id': run.run_id, 'error': str(e)}, ensure_ascii=False) + '\n'
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     global workflow
-    workflow = await setup_workflow()
+    workers = None
+    
+    missing = assets.missing(card_slugs())
+    if missing:
+        # Фронтенд покажет эти карты с GitHub, но хранилище стоит пересобрать: python assets.py
+        print(f"No local images for {len(missing)} cards: {', '.join(missing)}")
+    
+    if settings.graph_mode == 'queue' and settings.broker_url:
+        # Граф выполняют отдельные процессы worker.py
+        workflow = None
+    else:
+        workflow = await setup_workflow()
+        
+    if settings.graph_mode == 'queue' and not settings.broker_url:
+        # Локальная очередь: воркеры в том же процессе
+        workers = asyncio.create_task(GraphWorker(broker, workflow, settings.graph_workers, settings.job_retries).run())
+        
     yield
+    
+    if workers:
+        workers.cancel()
+    spreads.close()
 
 app = FastAPI(lifespan=lifespan)
 
 @app.post('/stream')
 async def stream_endpoint(item: UserData):
-    return StreamingResponse(stream_agent(item), media_type="application/json")
\ No newline at end of file
+    # Повторная отправка того же запроса подключается к уже идущему графу
+    run = runs.get_or_start(item.user_id, item.request_id, item.message, lambda: stream_agent(item))
+    return StreamingResponse(follow_run(run), media_type="application/x-ndjson")
+
+@app.get('/stream/{run_id}')
+async def resume_endpoint(run_id: str, user_id: str, cursor: int = 0, last_event_id: int | None = Header(None)):
+    # Докачка после обрыва: отдаём только события после курсора
+    run = runs.get(user_id, run_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail='Run not found or expired')
+
+    if last_event_id is not None:
+        cursor = last_event_id
+
+    return StreamingResponse(follow_run(run, cursor), media_type="application/x-ndjson")
+
+@app.post('/warm')
+async def warm_endpoint(item: ProfileData):
+    # Прогрев идёт в фоне, ответ сразу: started, pending, fresh или disabled
+    # (disabled — граф выполняют отдельные воркеры, прогревать здесь нечего)
+    return {'status': warmup.warm(item.user_id, item.birth_day, item.time_birth, item.city, item.country)}
+
+@app.post('/charts')
+async def chart_endpoint(item: ProfileData):
+    # Профиль изменился: сводка натальной карты считается в фоне, ход её уже не ждёт.
+    # В режиме queue с BROKER_URL у API нет MCP-инструментов и ответ — disabled:
+    # карту тогда ставит в расчёт воркер на первом астро-ходе (natal_chart)
+    # и кладёт в общий CHARTS_DIR — без него worker.py не запускается
+    args = chart_args(item.birth_day, item.time_birth, item.city, item.country)
+    if args is None:
+        raise HTTPException(status_code=422, detail='Incomplete birth data')
+    return {'version': profile_version(args), 'status': charts.schedule(args)}
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    info = {'mode': settings.graph_mode, 'runs': runs.stats(), 'llm': hedge_stats(), 'breakers': breaker_stats(), 'tiers': load.stats(), 'spreads': spreads.stats(), 'warmup': warmup.stats(), 'charts': charts.stats(), 'compaction': compactor.stats(), 'tool_cache': tool_cache.stats()}
+    if settings.graph_mode == 'queue':
+        info['queue'] = await broker.stats()
+        # Ходы выполняют воркеры, у API своей нагрузки графа нет — уровни по каждому воркеру
+        info['tiers'] = await broker.loads(3 * settings.load_report_interval)
+    return info
+
+@app.get('/cards/manifest')
+async def cards_manifest_endpoint():
+    return {'version': assets.version, 'sizes': SIZES, 'cards': assets.manifest}
+
+@app.get('/cards/{filename}')
+async def card_image_endpoint(filename: str):
+    path = assets.path(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail='Unknown card image')
+    return FileResponse(path, headers=IMMUTABLE)
+
+@app.post('/spreads')
+async def spread_image_endpoint(item: SpreadImageRequest):
+    # Весь расклад одной картинкой: один кешируемый запрос вместо картинки на каждую карту
+    if len(item.cards) != len(item.slots):
+        raise HTTPException(status_code=422, detail='Cards and slots count differ')
+    
+    try:
+        filename = await spreads.get(item)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=f'No local images for: {e.args[0]}')
+    
+    return {'url': f'/spreads/{filename}'}
+
+@app.get('/spreads/{filename}')
+async def spread_file_endpoint(filename: str):
+    path = await spreads.file(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail='Unknown spread image')
+    return FileResponse(path, headers=IMMUTABLE)
+
+@app.websocket('/ws/{user_id}')
+async def ws_endpoint(websocket: WebSocket, user_id: str):
+    # Одно соединение на сессию чата: ходы, отмена и статусы агента
+    await ChatSession(websocket, user_id, runs, stream_agent).serve()
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""Локальное хранилище картинок карт Таро.
+
+Сборка (один раз, после изменения колоды):
+
+    python assets.py                      # из репозитория tarot_images на GitHub
+    python assets.py --source ./images    # из локальной папки {slug}.jpeg
+
+Для каждой карты и каждого размера сохраняется WebP, прямая и перевёрнутая
+ориентация. Размер под место карты выбирают и разметка расклада на
+фронтенде, и сборщик картинок раскладов (`pick_size`). В имени файла — хеш
+содержимого, поэтому браузер может кешировать их бессрочно. manifest.json
+связывает карту с файлами.
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+
+from graph.agents.local_tarot import CARD_DATA_PATH
+import settings
+
+# Ширина в пикселях под размеры карт в раскладах (с запасом на HiDPI);
+# фронтенд получает их в /cards/manifest и выбирает вариант по ним
+SIZES = {'sm': 160, 'md': 240, 'lg': 480}
+# WebP понимают все браузеры, которым мы отдаём расклады, и Pillow в сборщике
+FORMATS = {'webp': 'WEBP'}
+ORIENTATIONS = ('upright', 'reversed')
+
+MANIFEST = 'manifest.json'
+
+
+def pick_size(width: float) -> str:
+    # Наименьший вариант не уже нужной ширины в пикселях, иначе самый большой
+    for size, size_width in sorted(SIZES.items(), key=lambda item: item[1]):
+        if size_width >= width:
+            return size
+    return max(SIZES, key=SIZES.get)
+
+
+def slugify(name: str) -> str:
+    # Как img_agent называет карты: "Ace of Cups" → "aceofcups"
+    return name.lower().replace(' ', '')
+
+
+def card_slugs(path: str = CARD_DATA_PATH) -> list[str]:
+    with open(path, encoding='utf-8') as f:
+        return [slugify(card['name']) for card in json.load(f)['cards']]
+
+
+def _read_source(source: str, slug: str) -> bytes:
+    if source.startswith(('http://', 'https://')):
+        import httpx
+        response = httpx.get(source.format(slug=slug), follow_redirects=True, timeout=30)
+        response.raise_for_status()
+        return response.content
+
+    with open(os.path.join(source, f'{slug}.jpeg'), 'rb') as f:
+        return f.read()
+
+
+def _variants(original: bytes):
+    # Pillow приходит вместе с matplotlib
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(original)).convert('RGB')
+
+    for orientation in ORIENTATIONS:
+        oriented = image.rotate(180) if orientation == 'reversed' else image
+
+        for size, width in SIZES.items():
+            height = round(oriented.height * width / oriented.width)
+            resized = oriented.resize((width, height), Image.Resampling.LANCZOS)
+
+            for fmt, pillow_format in FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, pillow_format, quality=82, optimize=True)
+                yield size, orientation, fmt, buffer.getvalue()
+
+
+def build(source: str, out_dir: str, slugs: list[str]) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+
+    for slug in slugs:
+        try:
+            original = _read_source(source, slug)
+        except Exception as e:
+            print(f"Skipped {slug}: {e}")
+            continue
+
+        for size, orientation, fmt, data in _variants(original):
+            digest = hashlib.sha256(data).hexdigest()[:12]
+            filename = f'{slug}-{size}-{orientation}.{digest}.{fmt}'
+
+            path = os.path.join(out_dir, filename)
+            if not os.path.exists(path):
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+            manifest.setdefault(slug, {}).setdefault(size, {}).setdefault(orientation, {})[fmt] = filename
+
+    with open(os.path.join(out_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+
+    return manifest
+
+
+class AssetStore:
+    """Читает manifest.json и отдаёт файлы по их хешированным именам.
+
+    `version` — хеш содержимого манифеста: клиенты кешируют по нему
+    собранную разметку и сбрасывают её после пересборки картинок.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.manifest = {}
+        self.files = set()
+
+        path = os.path.join(directory, MANIFEST)
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                self.manifest = json.load(f)
+
+        self.version = hashlib.sha256(json.dumps(self.manifest, sort_keys=True).encode()).hexdigest()[:12]
+
+        for sizes in self.manifest.values():
+            for orientations in sizes.values():
+                for formats in orientations.values():
+                    self.files.update(formats.values())
+
+    def path(self, filename: str) -> str | None:
+        # Только файлы из манифеста: никаких путей из запроса на диск
+        return os.path.join(self.directory, filename) if filename in self.files else None
+
+    def variant(self, slug: str, size: str = 'lg', orientation: str = 'upright', fmt: str = 'webp') -> str | None:
+        filename = self.manifest.get(slug, {}).get(size, {}).get(orientation, {}).get(fmt)
+        return os.path.join(self.directory, filename) if filename else None
+
+    def missing(self, slugs: list[str]) -> list[str]:
+        return [slug for slug in slugs if slug not in self.manifest]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--source', default=settings.assets_source, help='URL template with {slug} or a directory')
+    parser.add_argument('--out', default=settings.assets_dir)
+    args = parser.parse_args()
+
+    slugs = card_slugs()
+    manifest = build(args.source, args.out, slugs)
+    print(f"Built {len(manifest)} of {len(slugs)} cards into {args.out}")
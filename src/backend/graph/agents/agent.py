@@ -8,14 +8,36 @@ from langgraph.prebuilt import ToolNode
 from zep_cloud.client import AsyncZep
 
 from .config import base_url, zep_api
+from ..deadline import within
+from ..breaker import zep_breaker, tarot_mcp_breaker, astro_mcp_breaker
+from .hedge import HedgedAgent, hedge_model
+from .local_tarot import LocalTarot
+from .tools import guard_tools, cached_guard_tools, prefer, tool_cache
+from ..tiers import tier_max_tokens
+from ..warmup import warmup
+from ..charts import charts
 
 from .prompt import *
 from .schemas import RouterOutput, ImgOutput, Agents, UnlockCard, Summarize
 
 import os
+import httpx
 
 zep = AsyncZep(api_key=zep_api)
 
+# Один пул keep-alive соединений к OpenRouter на все модели процесса: прогретое
+# соединение достаётся любому агенту, а не только той модели, что его открыла
+openrouter_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(120, connect=10),
+    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60),
+)
+
+async def ping_openrouter():
+    # Любой ответ подходит: нужен только открытый TLS-канал в пуле
+    await openrouter_client.head(f'{base_url}/models')
+
+warmup.pools.append(ping_openrouter)
+
 @tool
 async def search_facts(config: RunnableConfig, query: str, limit: int = 3) -> list[str]:
     """Search for facts in all conversations had with a user.
@@ -26,9 +48,13 @@ async def search_facts(config: RunnableConfig, query: str, limit: int = 3) -> li
     Returns:
         list: A list of facts that match the search query.
     """
-    edges = await zep.graph.search(
-        user_id=config['configurable']["thread_id"], text=query, limit=limit, search_scope="edges"
-    )
+    try:
+        edges = await zep_breaker.call(lambda: within(config, 'zep', zep.graph.search(
+            user_id=config['configurable']["thread_id"], text=query, limit=limit, search_scope="edges"
+        )))
+    except Exception:
+        # Память недоступна — агент отвечает без неё
+        return []
     return [edge.fact for edge in edges]
 
 @tool
@@ -41,14 +67,21 @@ async def search_nodes(config: RunnableConfig, query: str, limit: int = 3) -> li
     Returns:
         list: A list of node summaries for nodes that match the search query.
     """
-    nodes = await zep.graph.search(
-        user_id=config['configurable']["thread_id"], text=query, limit=limit, search_scope="nodes"
-    )
+    try:
+        nodes = await zep_breaker.call(lambda: within(config, 'zep', zep.graph.search(
+            user_id=config['configurable']["thread_id"], text=query, limit=limit, search_scope="nodes"
+        )))
+    except Exception:
+        return []
     return [node.summary for node in nodes]
 
 
 async def create_tarot_agent():
-    llm = ChatOpenAI(base_url=base_url, model='openai/gpt-5-mini', temperature=0.2)
+    llm = ChatOpenAI(base_url=base_url, model='openai/gpt-5-mini', http_async_client=openrouter_client, temperature=0.2)
+    # Дешёвая модель на случай, если основная не уложилась в дедлайн
+    fast_llm = ChatOpenAI(base_url=base_url, model='openai/gpt-5-nano', http_async_client=openrouter_client, temperature=0.2)
+    # Страховка на случай, если основной маршрут OpenRouter тормозит
+    backup_llm = ChatOpenAI(base_url=base_url, model=hedge_model, http_async_client=openrouter_client, temperature=0.2)
     
     tarot_mcp_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../tarotmcp/dist/index.js"))
     
@@ -64,16 +97,25 @@ async def create_tarot_agent():
         
     )
     
-    tools = await client.get_tools()
+    # Если MCP-процесс лежит, расклад делает локальная колода
+    tools = cached_guard_tools(await client.get_tools(), tool_cache, tarot_mcp_breaker, LocalTarot().run)
     tools_node = ToolNode(tools + [search_facts, search_nodes])
     agent = llm.bind_tools(tools + [search_facts, search_nodes])
-    tarot_agent_chain = taro_prompt | agent
+    tarot_agent_chain = HedgedAgent(
+        taro_prompt | agent, 'openai/gpt-5-mini',
+        taro_prompt | backup_llm.bind_tools(tools + [search_facts, search_nodes]), hedge_model
+    )
+    tarot_fast_chain = taro_prompt | fast_llm.bind_tools(tools + [search_facts, search_nodes])
+    # Под нагрузкой: без хеджирования и с коротким ответом
+    tarot_lite_chain = taro_prompt | agent.bind(max_tokens=tier_max_tokens)
     
-    return tarot_agent_chain, tools_node
+    return tarot_agent_chain, tarot_fast_chain, tarot_lite_chain, tools_node
 
 
 async def create_astro_agent():
-    llm = ChatOpenAI(model='openai/gpt-5-mini',base_url=base_url, temperature=0.7)
+    llm = ChatOpenAI(model='openai/gpt-5-mini', base_url=base_url, http_async_client=openrouter_client, temperature=0.7)
+    fast_llm = ChatOpenAI(model='openai/gpt-5-nano', base_url=base_url, http_async_client=openrouter_client, temperature=0.7)
+    backup_llm = ChatOpenAI(model=hedge_model, base_url=base_url, http_async_client=openrouter_client, temperature=0.7)
     
     astro_mcp_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../astromcp/dist/main.js"))
     
@@ -88,50 +130,62 @@ async def create_astro_agent():
          }         
     )
     
-    tools = await client.get_tools()
+    mcp_tools = await client.get_tools()
+    # Карту, уже посчитанную для профиля, инструмент отдаёт без MCP
+    charts.chart_tool = next((tool for tool in mcp_tools if tool.name == 'get_chart'), None)
+    tools = [prefer(tool, charts.lookup) for tool in guard_tools(mcp_tools, astro_mcp_breaker)]
     tools_node = ToolNode(tools + [search_facts, search_nodes])
     agent = llm.bind_tools(tools + [search_facts, search_nodes])
     
-    astro_agent_chain = astro_prompt | agent
+    astro_agent_chain = HedgedAgent(
+        astro_prompt | agent, 'openai/gpt-5-mini',
+        astro_prompt | backup_llm.bind_tools(tools + [search_facts, search_nodes]), hedge_model
+    )
+    astro_fast_chain = astro_prompt | fast_llm.bind_tools(tools + [search_facts, search_nodes])
+    astro_lite_chain = astro_prompt | agent.bind(max_tokens=tier_max_tokens)
     
-    return astro_agent_chain, tools_node
+    return astro_agent_chain, astro_fast_chain, astro_lite_chain, tools_node
 
 def create_router_agent():
-    llm = ChatOpenAI(model='openai/gpt-5-nano',base_url=base_url, temperature=0)
+    llm = ChatOpenAI(model='openai/gpt-5-nano', base_url=base_url, http_async_client=openrouter_client, temperature=0)
     
     agent = router_prompt | llm.with_structured_output(RouterOutput)
     
     return agent
 
 def create_img_agent():
-    llm = ChatOpenAI(model='openai/gpt-5-mini',base_url=base_url, temperature=0)
+    llm = ChatOpenAI(model='openai/gpt-5-mini', base_url=base_url, http_async_client=openrouter_client, temperature=0)
     
     agent = img_prompt | llm.with_structured_output(ImgOutput)
     return agent
 
 def create_card_unlock_agent():
-    llm = ChatOpenAI(model='qwen/qwq-32b', base_url=base_url, temperature=0)
+    llm = ChatOpenAI(model='qwen/qwq-32b', base_url=base_url, http_async_client=openrouter_client, temperature=0)
     agent = unlock_card_prompt | llm.with_structured_output(UnlockCard)
     
     return agent
 
 def create_summarize_agent():
-    llm = ChatOpenAI(model='deepseek/deepseek-chat-v3.1', base_url=base_url, temperature=0)
+    llm = ChatOpenAI(model='deepseek/deepseek-chat-v3.1', base_url=base_url, http_async_client=openrouter_client, temperature=0)
     agent = summarize_prompt | llm.with_structured_output(Summarize)
     
     return agent
 
 async def create_agents():
-    taro_agent, taro_tool = await create_tarot_agent()
-    astro_agent, astro_tool = await create_astro_agent()
+    taro_agent, taro_fast_agent, taro_lite_agent, taro_tool = await create_tarot_agent()
+    astro_agent, astro_fast_agent, astro_lite_agent, astro_tool = await create_astro_agent()
     router_agent = create_router_agent()
     img_agent = create_img_agent()
     unlock_card_agent = create_card_unlock_agent()
     summarize_agent = create_summarize_agent()
     return Agents(
         taro_agent=taro_agent, 
+        taro_fast_agent=taro_fast_agent,
+        taro_lite_agent=taro_lite_agent,
         taro_tool=taro_tool, 
         astro_agent=astro_agent, 
+        astro_fast_agent=astro_fast_agent,
+        astro_lite_agent=astro_lite_agent,
         astro_tool=astro_tool,
         router_agent=router_agent, 
         img_agent=img_agent,
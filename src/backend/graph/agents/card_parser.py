@@ -0,0 +1,52 @@
+import re
+
+from langchain_core.messages import HumanMessage, ToolMessage
+
+from .schemas import TaroCard
+
+
+# Расклады, которые умеет рисовать фронтенд (как в img_prompt)
+SPREAD_NAMES = (
+    'Single Card', 'Three Card', 'Celtic Cross', 'Horseshoe', 'Relationship Cross', 'Career Path',
+    'Decision Making', 'Year Ahead', 'Spiritual Guidance', 'Chakra Alignment', 'Shadow Work',
+)
+
+# Формат perform_reading у tarot MCP (reading-manager.ts) и у LocalTarot:
+#   # Three Card Spread Reading
+#   **The Fool** (upright)
+HEADER = re.compile(r'^#\s+(.+?)\s+Reading\s*$', re.MULTILINE)
+CARD = re.compile(r'^\*\*(.+?)\*\*\s+\((upright|reversed)\)', re.MULTILINE)
+
+
+def _spread_name(title: str) -> str | None:
+    title = title.removesuffix(' Spread')
+    return title if title in SPREAD_NAMES else None
+
+
+def parse_reading(messages) -> tuple[list[TaroCard], str] | None:
+    """Достаёт карты и расклад из ответа perform_reading текущего хода без LLM.
+
+    Замена img_agent под нагрузкой. None — в этом ходе расклада не было
+    или фронтенд не умеет его рисовать.
+    """
+    for message in reversed(messages):
+        if isinstance(message, HumanMessage):
+            return None
+        if not isinstance(message, ToolMessage) or message.name != 'perform_reading':
+            continue
+
+        content = message.content
+        if not isinstance(content, str):
+            content = '\n'.join(block.get('text', '') if isinstance(block, dict) else str(block) for block in content)
+
+        header = HEADER.search(content)
+        unlock_name = _spread_name(header.group(1)) if header else None
+        if unlock_name is None:
+            return None
+
+        # Имена в том же виде, что и у img_agent: "Ace of Cups" → "aceofcups"
+        cards = [TaroCard(name=name.lower().replace(' ', ''), reversed=orientation == 'reversed')
+                 for name, orientation in CARD.findall(content)]
+        return (cards, unlock_name) if cards else None
+
+    return None
@@ -0,0 +1,150 @@
+import asyncio
+import os
+import time
+
+from collections import defaultdict, deque
+
+from langchain_core.messages.utils import message_chunk_to_message
+
+
+# Запасной запрос отправляется, если первый токен не пришёл за этот перцентиль
+hedge_percentile = float(os.getenv('HEDGE_PERCENTILE', '0.9'))
+# Доля ходов, которым разрешено платить за второй запрос
+hedge_max_ratio = float(os.getenv('HEDGE_MAX_RATIO', '0.1'))
+hedge_model = os.getenv('HEDGE_MODEL', 'google/gemini-2.5-flash')
+
+
+class LatencyTracker:
+    """Скользящее окно времени до первого токена по каждой модели."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20, default: float = 4.0,
+                 floor: float = 1.0, ceiling: float = 15.0):
+        self.min_samples = min_samples
+        self.default = default
+        self.floor = floor
+        self.ceiling = ceiling
+
+        self._samples = defaultdict(lambda: deque(maxlen=window))
+
+    def record(self, model: str, seconds: float):
+        self._samples[model].append(seconds)
+
+    def percentile(self, model: str, q: float) -> float | None:
+        samples = sorted(self._samples[model])
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def threshold(self, model: str, q: float) -> float:
+        if len(self._samples[model]) < self.min_samples:
+            return self.default
+        return min(self.ceiling, max(self.floor, self.percentile(model, q)))
+
+    def snapshot(self) -> dict:
+        return {
+            model: {q: self.percentile(model, q / 100) for q in (50, 90, 99)}
+            for model in self._samples
+        }
+
+
+tracker = LatencyTracker()
+
+stats = defaultdict(int)
+
+
+def hedge_stats() -> dict:
+    return {'first_token': tracker.snapshot(), **stats}
+
+
+class HedgedAgent:
+    """Обёртка над цепочкой агента со страховочным запросом к другой модели.
+
+    Основной запрос идёт потоком. Если первый токен не пришёл за
+    `hedge_percentile` наблюдаемых задержек модели, параллельно уходит
+    запрос к запасной цепочке. Берётся ответ того, кто первым начал отвечать,
+    второй отменяется. Страховочных запросов не больше `hedge_max_ratio` от
+    всех ходов.
+    """
+
+    def __init__(self, primary, primary_model: str, backup, backup_model: str):
+        self.primary = primary
+        self.primary_model = primary_model
+        self.backup = backup
+        self.backup_model = backup_model
+
+    def _can_hedge(self) -> bool:
+        return stats['hedged'] < hedge_max_ratio * stats['requests'] + 1
+
+    async def _stream(self, chain, model: str, inputs, config, started: asyncio.Event):
+        begin = time.monotonic()
+        answer = None
+
+        try:
+            async for chunk in chain.astream(inputs, config):
+                if answer is None:
+                    tracker.record(model, time.monotonic() - begin)
+                    started.set()
+                    answer = chunk
+                else:
+                    answer += chunk
+        except asyncio.CancelledError:
+            # Запрос, отменённый до первого токена, отвечал бы не быстрее прошедшего времени.
+            # Без этой цензурированной записи медленные ответы выпадают из окна, перцентиль
+            # занижается и страховка срабатывает всё чаще
+            if answer is None:
+                tracker.record(model, time.monotonic() - begin)
+                stats['censored'] += 1
+            raise
+        finally:
+            # Ошибка тоже «ответ» — гонку не нужно ждать до порога
+            started.set()
+
+        if answer is None:
+            raise RuntimeError(f'{model} finished the stream without a single chunk')
+        return message_chunk_to_message(answer)
+
+    async def ainvoke(self, inputs, config=None):
+        stats['requests'] += 1
+
+        primary_started = asyncio.Event()
+        primary = asyncio.create_task(self._stream(self.primary, self.primary_model, inputs, config, primary_started))
+        tasks = [primary]
+
+        try:
+            try:
+                await asyncio.wait_for(primary_started.wait(), tracker.threshold(self.primary_model, hedge_percentile))
+            except asyncio.TimeoutError:
+                if self._can_hedge():
+                    backup_started = asyncio.Event()
+                    backup = asyncio.create_task(self._stream(self.backup, self.backup_model, inputs, config, backup_started))
+                    tasks.append(backup)
+                    stats['hedged'] += 1
+
+                    return await self._race({primary: primary_started, backup: backup_started})
+
+            return await primary
+        finally:
+            # Проигравший запрос (или оба — при отмене по дедлайну) больше не нужен
+            for task in tasks:
+                task.cancel()
+
+    async def _race(self, started: dict):
+        waiters = {asyncio.create_task(event.wait()): task for task, event in started.items()}
+
+        try:
+            done, _ = await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+
+        first = waiters[done.pop()]
+        second = next(task for task in started if task is not first)
+
+        # Упавший до первого токена запрос не считается победителем
+        if first.done() and not first.cancelled() and first.exception():
+            first, second = second, first
+
+        if first is not next(iter(started)):
+            stats['backup_wins'] += 1
+
+        return await first
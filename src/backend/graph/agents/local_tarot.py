@@ -0,0 +1,66 @@
+import json
+import os
+import random
+
+
+CARD_DATA_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), "../../../tarotmcp/src/tarot/card-data.json"))
+
+SPREAD_SIZES = {
+    'single_card': 1,
+    'three_card': 3,
+    'celtic_cross': 10,
+    'horseshoe': 7,
+    'relationship_cross': 7,
+    'career_path': 6,
+    'decision_making': 5,
+    'spiritual_guidance': 6,
+    'year_ahead': 13,
+    'chakra_alignment': 7,
+    'shadow_work': 5,
+}
+
+
+class LocalTarot:
+    """Упрощённая замена tarot MCP на время, когда MCP-процесс не отвечает.
+
+    Колода та же (card-data.json сервера), но без сессий, аналитики и
+    поиска: только расклад, случайные карты и описание карты.
+    """
+
+    def __init__(self, path: str = CARD_DATA_PATH):
+        with open(path, encoding='utf-8') as f:
+            self.cards = json.load(f)['cards']
+        self.by_name = {card['name'].lower(): card for card in self.cards}
+
+    def _describe(self, card: dict, reversed: bool) -> str:
+        # Та же разметка, что у MCP: по ней card_parser находит карты без LLM
+        orientation = 'reversed' if reversed else 'upright'
+        keywords = ', '.join(card['keywords'][orientation])
+        meaning = card['meanings'][orientation]['general']
+        return f"**{card['name']}** ({orientation}) — {keywords}. {meaning}"
+
+    def perform_reading(self, spreadType: str, question: str, **_) -> str:
+        size = SPREAD_SIZES.get(spreadType, 3)
+        drawn = random.sample(self.cards, size)
+
+        title = spreadType.replace('_', ' ').title()
+        lines = [f'# {title} Reading', f'**Question:** {question}']
+        for position, card in enumerate(drawn, start=1):
+            lines.append(f'### {position}.')
+            lines.append(self._describe(card, random.random() < 0.5))
+        return '\n'.join(lines)
+
+    def get_random_cards(self, count: int = 1, **_) -> str:
+        drawn = random.sample(self.cards, min(count, len(self.cards)))
+        return '\n'.join(self._describe(card, random.random() < 0.5) for card in drawn)
+
+    def get_card_info(self, cardName: str, orientation: str = 'upright', **_) -> str:
+        card = self.by_name.get(cardName.lower())
+        if card is None:
+            return f'Card "{cardName}" not found'
+        return self._describe(card, orientation == 'reversed')
+
+    def run(self, tool_name: str, args: dict) -> str | None:
+        """Выполняет инструмент локально или возвращает None, если замены нет."""
+        handler = getattr(self, tool_name, None) if tool_name in ('perform_reading', 'get_random_cards', 'get_card_info') else None
+        return handler(**args) if handler else None
@@ -27,6 +27,7 @@ class AgentState(MessagesState):
     city: str
     country: str
     name: str
+    tier: str
     
 class ImgOutput(BaseModel):
     taro_cards: List[TaroCard] = Field(..., description='Fill this with name of taro card and reversed (bool)')
@@ -43,8 +44,12 @@ class Summarize(BaseModel):
     
 class Agents(BaseModel):
     taro_agent: object
+    taro_fast_agent: object
+    taro_lite_agent: object
     taro_tool: object
     astro_agent: object
+    astro_fast_agent: object
+    astro_lite_agent: object
     astro_tool: object
     router_agent: object
     img_agent: object
@@ -0,0 +1,194 @@
+import json
+import os
+import time
+
+from collections import Counter, OrderedDict, defaultdict
+
+from langchain_core.tools import StructuredTool, ToolException
+from pydantic import ValidationError
+
+from ..breaker import CircuitOpen
+
+
+# Сколько результатов инструментов держит кеш процесса
+tool_cache_items = int(os.getenv('TOOL_CACHE_ITEMS', '512'))
+
+# Политика кеша — сколько секунд жив результат: ALWAYS — пока не вытеснен,
+# NEVER — не кешировать. Инструментов без политики кеш не касается
+ALWAYS = float('inf')
+NEVER = 0
+
+# Колода в tarot MCP не меняется, поэтому справочные инструменты кешируются
+# навсегда; аналитика — на час. perform_reading, get_random_cards и
+# create_custom_spread тянут случайные карты и не кешируются никогда
+TAROT_CACHE_POLICY = {
+    'get_card_info': ALWAYS,
+    'list_all_cards': ALWAYS,
+    'search_cards': ALWAYS,
+    'find_similar_cards': ALWAYS,
+    'get_database_analytics': 3600,
+    'perform_reading': NEVER,
+    'get_random_cards': NEVER,
+    'create_custom_spread': NEVER,
+}
+
+
+# Сервер ответил, но вызов неверен — зависимость здесь ни при чём
+TOOL_ERRORS = (ToolException, ValidationError)
+
+
+def guard_tool(tool, breaker, fallback=None):
+    """Оборачивает MCP-инструмент предохранителем.
+
+    Пока MCP-сервер отвечает, вызов идёт как есть (с одним повтором). Когда
+    предохранитель открыт или упал транспорт либо процесс сервера, отвечает
+    `fallback(name, args)`, а если замены нет — инструмент сообщает агенту,
+    что он недоступен. Ошибку аргументов или самого инструмента сервер
+    вернул штатно: она уходит агенту как есть, без повтора и без отметки
+    отказа в предохранителе.
+    """
+
+    def unavailable(kwargs):
+        result = fallback(tool.name, kwargs) if fallback else None
+        return result if result is not None else f'{tool.name} is temporarily unavailable, answer without it'
+
+    async def run(**kwargs):
+        try:
+            return await breaker.call(lambda: tool.ainvoke(kwargs), retries=1, ignore=TOOL_ERRORS)
+        except CircuitOpen:
+            return unavailable(kwargs)
+        except TOOL_ERRORS as e:
+            return f'{tool.name} error: {e}'
+        except Exception as e:
+            print(f"Tool {tool.name} unavailable: {e!r}")
+            return unavailable(kwargs)
+
+    return StructuredTool.from_function(
+        coroutine=run,
+        name=tool.name,
+        description=tool.description,
+        args_schema=tool.args_schema,
+    )
+
+
+def guard_tools(tools, breaker, fallback=None):
+    return [guard_tool(tool, breaker, fallback) for tool in tools]
+
+
+def canonical(value):
+    # Один ключ для «The Fool» и « the  fool», 3 и 3.0, явного None и пропущенного аргумента
+    if isinstance(value, dict):
+        return {key: canonical(item) for key, item in sorted(value.items()) if item is not None}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, str):
+        return ' '.join(value.split()).casefold()
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class ToolCache:
+    """LRU результатов детерминированных инструментов MCP.
+
+    Ключ — имя инструмента и канонизированные аргументы (с подставленными
+    значениями по умолчанию из схемы). Время жизни задаёт политика
+    инструмента. Записывается только настоящий ответ MCP: заглушки
+    guard_tool при сбое в кеш не попадают.
+    """
+
+    def __init__(self, max_items: int, policies: dict):
+        self.max_items = max_items
+        self.policies = policies
+
+        # ключ → (истекает, результат)
+        self.items = OrderedDict()
+        self.defaults = {}
+        self.counts = defaultdict(Counter)
+
+    def cacheable(self, name: str) -> bool:
+        return self.policies.get(name, NEVER) > 0
+
+    def key(self, name: str, args: dict) -> str:
+        args = {**self.defaults.get(name, {}), **args}
+        return json.dumps([name, canonical(args)], ensure_ascii=False, separators=(',', ':'))
+
+    def lookup(self, name: str, args: dict):
+        if not self.cacheable(name):
+            return None
+
+        key = self.key(name, args)
+        entry = self.items.get(key)
+        if entry is None:
+            self.counts[name]['misses'] += 1
+            return None
+
+        expires, result = entry
+        if expires < time.monotonic():
+            del self.items[key]
+            self.counts[name]['expired'] += 1
+            return None
+
+        self.items.move_to_end(key)
+        self.counts[name]['hits'] += 1
+        return result
+
+    def store(self, name: str, args: dict, result):
+        key = self.key(name, args)
+        self.items[key] = (time.monotonic() + self.policies[name], result)
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def storing(self, tool):
+        """Инструмент, который кладёт свой успешный результат в кеш."""
+        schema = tool.args_schema if isinstance(tool.args_schema, dict) else {}
+        self.defaults[tool.name] = {
+            name: spec['default'] for name, spec in schema.get('properties', {}).items() if 'default' in spec
+        }
+
+        async def run(**kwargs):
+            result = await tool.ainvoke(kwargs)
+            self.store(tool.name, kwargs, result)
+            return result
+
+        return StructuredTool.from_function(
+            coroutine=run,
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+        )
+
+    def stats(self) -> dict:
+        return {'items': len(self.items), 'tools': {name: dict(counts) for name, counts in self.counts.items()}}
+
+
+tool_cache = ToolCache(tool_cache_items, TAROT_CACHE_POLICY)
+
+
+def cached_guard_tools(tools, cache, breaker, fallback=None):
+    """guard_tools с кешем: попадание отвечает сразу, без предохранителя и MCP."""
+    guarded = []
+    for tool in tools:
+        if cache.cacheable(tool.name):
+            guarded.append(prefer(guard_tool(cache.storing(tool), breaker, fallback), cache.lookup))
+        else:
+            guarded.append(guard_tool(tool, breaker, fallback))
+    return guarded
+
+
+def prefer(tool, lookup):
+    """Отвечает готовым результатом `lookup(name, args)`, если он есть, иначе вызывает инструмент."""
+
+    async def run(**kwargs):
+        result = lookup(tool.name, kwargs)
+        if result is not None:
+            return result
+        return await tool.ainvoke(kwargs)
+
+    return StructuredTool.from_function(
+        coroutine=run,
+        name=tool.name,
+        description=tool.description,
+        args_schema=tool.args_schema,
+    )
@@ -0,0 +1,149 @@
+import asyncio
+import random
+import time
+
+from collections import deque
+
+from .deadline import BudgetExhausted
+
+
+class CircuitOpen(Exception):
+    """Зависимость признана нерабочей, вызов даже не начинался."""
+
+
+class CircuitBreaker:
+    """Предохранитель для внешней зависимости (Zep, MCP, OpenRouter).
+
+    closed    — вызовы идут как обычно, исходы копятся в окне `window` секунд;
+    open      — доля ошибок в окне превысила `failure_rate` (при минимум
+                `min_calls` вызовах): вызовы сразу падают с CircuitOpen, без
+                ожидания таймаутов;
+    half_open — через `cooldown` секунд пропускается `probes` пробных вызовов,
+                успех закрывает предохранитель, ошибка снова открывает.
+
+    Каждая смена состояния начинает новое поколение. `allow` выдаёт пропуск
+    с поколением и признаком пробы, и `record` учитывает исход только своего
+    поколения: вызов, пропущенный ещё в closed и закончившийся после
+    открытия, не закроет предохранитель и не собьёт счёт проб.
+    """
+
+    def __init__(self, name: str, window: float = 30, min_calls: int = 5, failure_rate: float = 0.5,
+                 cooldown: float = 15, probes: int = 1):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.cooldown = cooldown
+        self.probes = probes
+
+        self.state = 'closed'
+        self.generation = 0
+        self.opened_at = 0.0
+        self.probing = 0
+
+        self._outcomes = deque()
+
+    def _trim(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def _switch(self, state: str):
+        self.state = state
+        self.generation += 1
+        self.probing = 0
+
+    def _open(self, now: float):
+        self._switch('open')
+        self.opened_at = now
+        print(f"Circuit {self.name} opened")
+
+    def allow(self) -> tuple[int, bool] | None:
+        """Пропуск `(поколение, проба ли это)` или None, если вызывать нельзя."""
+        if self.state == 'closed':
+            return self.generation, False
+
+        if self.state == 'open':
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return None
+            self._switch('half_open')
+
+        if self.probing < self.probes:
+            self.probing += 1
+            return self.generation, True
+        return None
+
+    def release(self, ticket: tuple[int, bool]):
+        # Проба без исхода (отмена, нет бюджета) освобождает свой слот
+        generation, probe = ticket
+        if probe and generation == self.generation:
+            self.probing -= 1
+
+    def record(self, ticket: tuple[int, bool], ok: bool):
+        generation, probe = ticket
+        if generation != self.generation:
+            # Вызов пропущен в другом состоянии — его исход уже ничего не говорит
+            return
+
+        now = time.monotonic()
+
+        if probe:
+            if ok:
+                self._switch('closed')
+                self._outcomes.clear()
+                print(f"Circuit {self.name} closed")
+            else:
+                self._open(now)
+            return
+
+        self._outcomes.append((now, ok))
+        self._trim(now)
+
+        failures = sum(1 for _, success in self._outcomes if not success)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._open(now)
+
+    async def call(self, factory, retries: int = 0, base_delay: float = 0.2, ignore: tuple = ()):
+        """Вызывает `factory()` с повторами и джиттером; при открытом предохранителе — CircuitOpen.
+
+        Таймауты не повторяются: они означают, что бюджет хода уже потрачен.
+        Исключения из `ignore` (ошибки самого вызова, а не зависимости) не
+        повторяются и не считаются отказом.
+        """
+        for attempt in range(retries + 1):
+            ticket = self.allow()
+            if ticket is None:
+                raise CircuitOpen(self.name)
+
+            try:
+                result = await factory()
+            except (asyncio.CancelledError, BudgetExhausted, *ignore):
+                # Вызова не было, он отменён или отвергнут по аргументам — это не исход зависимости,
+                # и проба не должна навсегда занять слот half_open
+                self.release(ticket)
+                raise
+            except Exception as e:
+                self.record(ticket, False)
+                if attempt == retries or isinstance(e, asyncio.TimeoutError):
+                    raise
+                await asyncio.sleep(random.uniform(0, base_delay * 2 ** attempt))
+            else:
+                self.record(ticket, True)
+                return result
+
+    def stats(self) -> dict:
+        self._trim(time.monotonic())
+        return {
+            'state': self.state,
+            'calls': len(self._outcomes),
+            'failures': sum(1 for _, ok in self._outcomes if not ok),
+        }
+
+
+zep_breaker = CircuitBreaker('zep')
+llm_breaker = CircuitBreaker('openrouter', min_calls=10)
+tarot_mcp_breaker = CircuitBreaker('mcp_tarot')
+astro_mcp_breaker = CircuitBreaker('mcp_astro')
+
+
+def breaker_stats() -> dict:
+    return {breaker.name: breaker.stats() for breaker in (zep_breaker, llm_breaker, tarot_mcp_breaker, astro_mcp_breaker)}
@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+
+from collections import Counter, OrderedDict
+from datetime import datetime
+from pathlib import Path
+
+from .breaker import astro_mcp_breaker
+
+
+# Готовые натальные карты: по JSON-файлу на версию профиля;
+# воркерам режима queue нужен общий каталог (worker.py без него не стартует)
+charts_dir = os.getenv('CHARTS_DIR', os.path.join(os.path.dirname(__file__), '..', 'static', 'charts'))
+# Сколько карт держим в памяти процесса
+charts_memory_items = int(os.getenv('CHARTS_MEMORY_ITEMS', '1024'))
+# Потолок на расчёт одной карты
+chart_timeout = float(os.getenv('CHART_TIMEOUT', '30'))
+
+MAJOR_ASPECTS = ('conjunction', 'opposition', 'trine', 'square', 'sextile')
+
+# Строки chart2txt: «Sun is at 10° Capricorn.», «Sun is in house 4.»,
+# «Sun is in conjunction with Mercury (orb: 3.8°).»
+POSITION = re.compile(r'(\w[\w ]*?) is at (\d+)° (\w+)\.')
+HOUSE = re.compile(r'(\w[\w ]*?) is in house (\d+)\.')
+ASPECT = re.compile(r'(\w[\w ]*?) is in (\w+) with (\w[\w ]*?) \(orb: ([\d.]+)°\)\.')
+
+
+def chart_args(birth_day: str | None, time_birth: str | None, city: str | None, country: str | None) -> dict | None:
+    # В профиле 30.08.1999 и 12:45, get_chart ждёт 1999-08-30 и 12:45:00
+    try:
+        date = datetime.strptime(birth_day, '%d.%m.%Y').strftime('%Y-%m-%d')
+        at = datetime.strptime(time_birth or '12:00', '%H:%M').strftime('%H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+
+    if not city:
+        return None
+    return {'date': date, 'time': at, 'location': f'{city}, {country}' if country else city}
+
+
+def args_key(args: dict) -> str:
+    return json.dumps(args, sort_keys=True, ensure_ascii=False)
+
+
+def profile_version(args: dict) -> str:
+    # Новая дата, время или место — новая версия; старая карта просто перестаёт спрашиваться
+    return hashlib.sha256(args_key(args).encode()).hexdigest()[:16]
+
+
+def parse_chart(text: str) -> dict:
+    """Положения, дома и мажорные аспекты из текста get_chart."""
+    aspects = [
+        [first, kind, second, float(orb)]
+        for first, kind, second, orb in ASPECT.findall(text)
+        if kind in MAJOR_ASPECTS
+    ]
+    return {
+        'positions': {body: f'{degree}° {sign}' for body, degree, sign in POSITION.findall(text)},
+        'houses': {body: int(house) for body, house in HOUSE.findall(text)},
+        'aspects': sorted(aspects, key=lambda aspect: aspect[3]),
+    }
+
+
+def summary_text(summary: dict) -> str:
+    # Компактно для промпта: одна строка на раздел
+    houses = summary['houses']
+    positions = '; '.join(
+        f'{body} {position}' + (f' H{houses[body]}' if body in houses else '')
+        for body, position in summary['positions'].items()
+    )
+    aspects = '; '.join(f'{first} {kind} {second} {orb}°' for first, kind, second, orb in summary['aspects'])
+    return f'Positions: {positions}\nAspects: {aspects or "none"}'
+
+
+class ChartStore:
+    """Натальные карты по версии профиля: память поверх каталога JSON-файлов.
+
+    Карта считается один раз через MCP-инструмент get_chart — в фоне, когда
+    пользователь сохранил профиль или вошёл в чат. В файле лежат и полный
+    текст (им отвечает инструмент астро-агента), и сжатая сводка (она идёт
+    прямо в промпт, и агенту не нужен вызов инструмента).
+    """
+
+    def __init__(self, directory: str, memory_items: int, timeout: float):
+        self.directory = Path(directory)
+        self.memory_items = memory_items
+        self.timeout = timeout
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # Заполняется при сборке астро-агента
+        self.chart_tool = None
+
+        self.memory = OrderedDict()
+        self.pending = {}
+        self.counts = Counter()
+
+    def _path(self, version: str) -> Path:
+        return self.directory / f'{version}.json'
+
+    def get(self, args: dict | None) -> dict | None:
+        if args is None:
+            return None
+
+        version = profile_version(args)
+        chart = self.memory.get(version)
+        if chart is not None:
+            self.memory.move_to_end(version)
+            return chart
+
+        try:
+            chart = json.loads(self._path(version).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return None
+
+        self._remember(version, chart)
+        return chart
+
+    def _remember(self, version: str, chart: dict):
+        self.memory[version] = chart
+        self.memory.move_to_end(version)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def schedule(self, args: dict | None) -> str:
+        """Ставит расчёт в фон, если карты ещё нет: ready, pending, started или disabled."""
+        if args is None or self.chart_tool is None:
+            return 'disabled'
+        if self.get(args) is not None:
+            return 'ready'
+
+        version = profile_version(args)
+        if version in self.pending:
+            return 'pending'
+
+        self._start(version, args)
+        return 'started'
+
+    async def ensure(self, args: dict) -> dict:
+        chart = self.get(args)
+        if chart is not None:
+            return chart
+        return await asyncio.shield(self._start(profile_version(args), args))
+
+    def _start(self, version: str, args: dict) -> asyncio.Task:
+        # Один расчёт на версию, сколько бы запросов его ни ждали
+        task = self.pending.get(version)
+        if task is None:
+            task = asyncio.create_task(self._compute(version, args))
+            self.pending[version] = task
+            task.add_done_callback(lambda task: self._done(version, task))
+        return task
+
+    def _done(self, version: str, task: asyncio.Task):
+        self.pending.pop(version, None)
+        # Ошибку уже напечатал _compute; забираем её, чтобы asyncio не ругался на фоновые расчёты
+        if not task.cancelled():
+            task.exception()
+
+    async def _compute(self, version: str, args: dict) -> dict:
+        try:
+            # Сырой MCP-инструмент: ошибка не должна попасть в файл как текст карты
+            text = await astro_mcp_breaker.call(lambda: asyncio.wait_for(self.chart_tool.ainvoke(args), self.timeout))
+        except Exception as e:
+            self.counts['failed'] += 1
+            print(f"Chart {version} failed: {e!r}")
+            raise
+
+        summary = parse_chart(text)
+        chart = {'version': version, 'args': args, 'text': text, 'summary': summary, 'prompt': summary_text(summary)}
+
+        path = self._path(version)
+        tmp = path.with_suffix('.tmp')
+        tmp.write_text(json.dumps(chart, ensure_ascii=False), encoding='utf-8')
+        tmp.replace(path)
+
+        self._remember(version, chart)
+        self.counts['computed'] += 1
+        return chart
+
+    def lookup(self, name: str, args: dict) -> str | None:
+        # Для prefer(): готовый текст карты вместо нового вызова get_chart
+        if name != 'get_chart':
+            return None
+
+        chart = self.get(args)
+        if chart is None:
+            return None
+        self.counts['tool_hits'] += 1
+        return chart['text']
+
+    def stats(self) -> dict:
+        return {'memory': len(self.memory), 'pending': len(self.pending), **self.counts}
+
+
+charts = ChartStore(charts_dir, charts_memory_items, chart_timeout)
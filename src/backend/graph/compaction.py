@@ -0,0 +1,151 @@
+import os
+import re
+
+from collections import defaultdict
+
+from langchain_core.messages import ToolMessage
+
+from .charts import parse_chart, summary_text
+
+
+# Вывод инструмента без своего правила обрезается до этой длины
+tool_output_max_chars = int(os.getenv('TOOL_OUTPUT_MAX_CHARS', '4000'))
+
+# perform_reading у tarot MCP (reading-manager.ts, formatReading):
+#   ### 1. Past/Situation / *смысл позиции* / **The Fool** (upright) / *Keywords: ...*
+#   ## Interpretation / **Past/Situation**: The Fool (upright) / толкование
+READING_HEADER = re.compile(r'^#[ \t]+.+?[ \t]+Reading[ \t]*$', re.MULTILINE)
+QUESTION = re.compile(r'^\*\*Question:\*\*.*$', re.MULTILINE)
+DRAWN = re.compile(
+    r'^###\s+\d+\.\s+(?P<position>.+?)\n(?:\*.+?\*\n\n)?\*\*(?P<card>.+?)\*\*\s+\((?P<orientation>upright|reversed)\)\n\n\*Keywords:\s*(?P<keywords>.+?)\*$',
+    re.MULTILINE,
+)
+MEANING = re.compile(r'^\*\*(?P<position>.+?)\*\*:\s+.+?\s+\((?:upright|reversed)\)\n(?P<meaning>.+)$', re.MULTILINE)
+# get_card_info: описание и символика агенту для толкования не нужны
+CARD_INFO_DROP = re.compile(r'^\*\*Description:\*\*.*?\n\n|^## Symbolism\n\n(?:•.*\n)+\n?', re.MULTILINE)
+# list_all_cards: «• **The Fool** (0) - beginnings, ...» → «The Fool»
+LISTED_CARD = re.compile(r'^•\s+\*\*(.+?)\*\*.*$', re.MULTILINE)
+
+
+def truncate(text: str) -> str:
+    if len(text) <= tool_output_max_chars:
+        return text
+    return text[:tool_output_max_chars] + '\n[...truncated]'
+
+
+def compact_reading(text: str) -> str:
+    """Расклад: строка на карту с позицией, ключевыми словами и толкованием.
+
+    Заголовок и строки «**Карта** (ориентация)» остаются в начале строки —
+    по ним card_parser находит карты без LLM. Дата, id расклада и общие
+    шаблонные абзацы отбрасываются.
+    """
+    drawn = list(DRAWN.finditer(text))
+    header = READING_HEADER.search(text)
+    if not drawn or header is None:
+        # Другой формат (например, LocalTarot) — он и так короткий
+        return truncate(text)
+
+    meanings = {match['position']: match['meaning'].strip() for match in MEANING.finditer(text)}
+    question = QUESTION.search(text)
+
+    lines = [header.group(0)]
+    if question:
+        lines.append(question.group(0))
+    for match in drawn:
+        meaning = meanings.get(match['position'])
+        line = f"**{match['card']}** ({match['orientation']}) — {match['position']}; {match['keywords']}"
+        lines.append(f'{line}. {meaning}' if meaning else line)
+    return '\n'.join(lines)
+
+
+def compact_chart(text: str) -> str:
+    summary = parse_chart(text)
+    if not summary['positions']:
+        return truncate(text)
+    return f'{text.splitlines()[0]}\n{summary_text(summary)}'
+
+
+def compact_card_info(text: str) -> str:
+    return truncate(CARD_INFO_DROP.sub('', text))
+
+
+def compact_card_list(text: str) -> str:
+    names = LISTED_CARD.findall(text)
+    return ', '.join(names) if names else truncate(text)
+
+
+# Правила по имени инструмента; остальные просто обрезаются
+RULES = {
+    'perform_reading': compact_reading,
+    'create_custom_spread': compact_reading,
+    'get_chart': compact_chart,
+    'get_card_info': compact_card_info,
+    'list_all_cards': compact_card_list,
+}
+
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding('o200k_base')
+        except Exception:
+            # Без tiktoken — грубая оценка, для сравнения «до/после» её хватает
+            _encoding = False
+    return len(_encoding.encode(text)) if _encoding else len(text) // 4
+
+
+def _text(content) -> str:
+    if isinstance(content, str):
+        return content
+    return '\n'.join(block.get('text', '') if isinstance(block, dict) else str(block) for block in content)
+
+
+class ToolCompactor:
+    """Сжимает вывод инструментов до того, как он попадёт в AgentState.
+
+    Полный текст живёт только внутри вызова: в историю сообщений и во все
+    следующие запросы к LLM идёт сжатая версия. Счётчики токенов «до» и
+    «после» по каждому инструменту — в /metrics.
+    """
+
+    def __init__(self, rules: dict):
+        self.rules = rules
+        self.counts = defaultdict(lambda: {'calls': 0, 'tokens_before': 0, 'tokens_after': 0})
+
+    def compact(self, message: ToolMessage) -> ToolMessage:
+        if not isinstance(message, ToolMessage) or message.status == 'error':
+            return message
+
+        text = _text(message.content)
+        rule = self.rules.get(message.name, truncate)
+        try:
+            compacted = rule(text)
+        except Exception as e:
+            print(f"Compaction of {message.name} failed: {e!r}")
+            compacted = truncate(text)
+
+        counts = self.counts[message.name]
+        counts['calls'] += 1
+        counts['tokens_before'] += count_tokens(text)
+        counts['tokens_after'] += count_tokens(compacted)
+
+        # artifact тоже сбрасываем: иначе полный вывод MCP всё равно ляжет в состояние
+        return message.model_copy(update={'content': compacted, 'artifact': None})
+
+    def compact_update(self, update: dict) -> dict:
+        messages = update.get('messages') if isinstance(update, dict) else None
+        if not messages:
+            return update
+        return {**update, 'messages': [self.compact(message) for message in messages]}
+
+    def stats(self) -> dict:
+        return {name: dict(counts) for name, counts in self.counts.items()}
+
+
+compactor = ToolCompactor(RULES)
@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+from langchain_core.runnables import RunnableConfig
+
+
+# Доля общего бюджета запроса, которую может занять один вызов на этапе
+STAGE_SHARES = {
+    'take_context': 0.1,
+    'router_node': 0.15,
+    'agent': 0.4,
+    'tool': 0.25,
+    'zep': 0.1,
+    'img_node': 0.15,
+    'add_memory': 0.1,
+    # запасной путь забирает всё, что осталось
+    'fallback': 1.0,
+}
+
+
+class BudgetExhausted(asyncio.TimeoutError):
+    """Бюджет закончился до вызова — зависимость тут ни при чём."""
+
+
+class Deadline:
+    """Сквозной дедлайн одного хода.
+
+    Хранит абсолютное время (time.time), поэтому переживает передачу задачи
+    через очередь в другой процесс.
+    """
+
+    def __init__(self, timeout: float, started_at: float | None = None):
+        self.timeout = timeout
+        self.expires_at = (started_at or time.time()) + timeout
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.time())
+
+    def budget(self, stage: str) -> float:
+        return min(self.remaining(), self.timeout * STAGE_SHARES[stage])
+
+
+def get_deadline(config: RunnableConfig | None) -> Deadline | None:
+    return (config or {}).get('configurable', {}).get('deadline')
+
+
+async def within(config: RunnableConfig | None, stage: str, awaitable):
+    """Ждёт `awaitable` не дольше бюджета этапа, иначе asyncio.TimeoutError."""
+    deadline = get_deadline(config)
+    if deadline is None:
+        return await awaitable
+
+    budget = deadline.budget(stage)
+    if budget <= 0:
+        awaitable.close()
+        raise BudgetExhausted(f'No time left for {stage}')
+
+    return await asyncio.wait_for(awaitable, budget)
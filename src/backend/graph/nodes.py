@@ -4,10 +4,20 @@ from langgraph.constants import END
 
 from zep_cloud.client import AsyncZep
 from zep_cloud import Message
+from zep_cloud.core.api_error import ApiError
+from zep_cloud.errors import NotFoundError
 
 from langchain_core.runnables import RunnableConfig
+from langchain_core.messages import AIMessage, ToolMessage
 
 from .agents import *
+from .agents.card_parser import parse_reading
+from .deadline import within
+from .tiers import get_tier
+from .warmup import warmup
+from .charts import charts, chart_args
+from .compaction import compactor
+from .breaker import CircuitOpen, llm_breaker, zep_breaker
 from dotenv import load_dotenv
 
 import os
@@ -15,6 +25,44 @@ import asyncio
 
 load_dotenv()
 
+FALLBACK_MESSAGE = 'The stars are silent right now 🌙 Please ask me again in a moment.'
+
+ASTRO_WORDS = ('astro', 'natal', 'horoscope', 'zodiac', 'астро', 'натал', 'гороскоп', 'зодиак')
+
+
+async def _create_or_exists(create, get):
+    """Идемпотентное создание в Zep: `create()`, а если объект уже есть — успех.
+
+    На повторное создание Zep отвечает 400/409, но текст ошибки не контракт
+    SDK, поэтому существование подтверждается чтением `get()`. Тот же приём
+    у фронтенда — provisioning.create_or_exists.
+    """
+    try:
+        await create()
+    except ApiError as e:
+        if e.status_code not in (400, 409):
+            raise
+        try:
+            await get()
+        except NotFoundError:
+            raise e
+
+
+async def ensure_thread(zep: AsyncZep, user_id: str, name: str | None = None):
+    """Пользователь и тред в Zep; уже заведённые не трогаются.
+
+    Фронтенд заводит их в фоне и не ждёт, поэтому первый ход может прийти
+    раньше. Тред и пользователь — с тем же id, что и у фронтенда.
+    """
+    await _create_or_exists(
+        lambda: zep.user.add(user_id=user_id, first_name=name),
+        lambda: zep.user.get(user_id),
+    )
+    await _create_or_exists(
+        lambda: zep.thread.create(thread_id=user_id, user_id=user_id),
+        lambda: zep.thread.get(user_id, limit=1),
+    )
+
 
 async def setup_workflow():
     agents = await create_agents()
@@ -22,30 +70,88 @@ async def setup_workflow():
     zep_api = os.getenv('ZEP_API')
     
     zep = AsyncZep(api_key=zep_api)
+    warmup.zep = zep
     
     async def take_context(state, config: RunnableConfig):
         session_id = config['configurable']["thread_id"]
         user_name = state['name']
         
+        # Первый ход после входа: контекст уже забран прогревом
+        warm = warmup.take_context(session_id)
+        if warm is not None:
+            return {'context': f'User name: {user_name}\n Context: {warm}'}
+        
         try:
-            memory = await zep.thread.get_user_context(session_id)
+            # Треда ещё нет (фоновое заведение не дошло) — это не отказ Zep
+            memory = await zep_breaker.call(lambda: within(config, 'take_context', zep.thread.get_user_context(session_id)), ignore=(NotFoundError,))
             context = f'User name: {user_name}\n Context: {memory.context}'
         except:
+            # Нет времени, Zep недоступен или его предохранитель открыт — отвечаем без контекста
             context = f'User name: {user_name}'
          
         return {'context': context}
     
-    async def router_node(state):
-        answer = await agents.router_agent.ainvoke({'messages': state['messages'], 'context': state['context']})
+    async def router_node(state, config: RunnableConfig):
         user_message = state['messages'][-1].content
         
+        try:
+            answer = await llm_breaker.call(lambda: within(config, 'router_node', agents.router_agent.ainvoke({'messages': state['messages'], 'context': state['context']})))
+        except Exception:
+            # Роутер не успел или OpenRouter недоступен — выбираем ветку по ключевым словам
+            is_astro = any(word in user_message.lower() for word in ASTRO_WORDS)
+            return {'next_node': 'astro_node' if is_astro else 'taro_node', 'user_message': user_message}
+        
         if answer.next_node == 'add_memory':
             return {'message_to_user': answer.message, 'next_node': answer.next_node, 'user_message': user_message}
         
         return {'next_node': answer.next_node, 'user_message': user_message}
 
-    async def astro_node(state):
-        answer = await agents.astro_agent.ainvoke({'messages': state['messages'], 'birth_day': state['birth_day'], 'time_birth': state['time_birth'], 'city': state['city'], 'country': state['country'], 'context': state['context']})
+    async def call_agent(config, agent, fast_agent, lite_agent, inputs):
+        tier = get_tier(config)
+        if tier == 'reduced':
+            agent = lite_agent
+        elif tier == 'minimal':
+            agent = fast_agent
+        
+        try:
+            return await llm_breaker.call(lambda: within(config, 'agent', agent.ainvoke(inputs)))
+        except CircuitOpen:
+            # OpenRouter лежит — не ждём, сразу извиняемся
+            return AIMessage(content=FALLBACK_MESSAGE)
+        except Exception as e:
+            if agent is fast_agent:
+                return AIMessage(content=FALLBACK_MESSAGE)
+            print(f"Agent call failed, trying fast model: {e!r}")
+        
+        # Основная модель не уложилась в свою долю или упала — пробуем быструю на остатке
+        try:
+            return await llm_breaker.call(lambda: within(config, 'fallback', fast_agent.ainvoke(inputs)))
+        except Exception:
+            return AIMessage(content=FALLBACK_MESSAGE)
+    
+    def call_tools(tool_node):
+        async def tools(state, config: RunnableConfig):
+            try:
+                # В состояние и в следующий запрос к LLM идёт сжатый вывод, а не полный текст MCP
+                return compactor.compact_update(await within(config, 'tool', tool_node.ainvoke(state, config)))
+            except asyncio.TimeoutError:
+                tool_calls = state['messages'][-1].tool_calls
+                return {'messages': [ToolMessage(content='Tool timed out, answer without it', tool_call_id=call['id'], status='error') for call in tool_calls]}
+        
+        return tools
+
+    def natal_chart(state):
+        args = chart_args(state['birth_day'], state['time_birth'], state['city'], state['country'])
+        chart = charts.get(args)
+        if chart is None:
+            # Профиль сохранён до появления сводок или расчёт не удался — досчитаем к следующему ходу
+            charts.schedule(args)
+            return 'Not calculated yet, use the tool (astrology) for the natal chart.'
+        return chart['prompt']
+
+    async def astro_node(state, config: RunnableConfig):
+        inputs = {'messages': state['messages'], 'birth_day': state['birth_day'], 'time_birth': state['time_birth'], 'city': state['city'], 'country': state['country'], 'context': state['context'], 'chart': natal_chart(state)}
+        answer = await call_agent(config, agents.astro_agent, agents.astro_fast_agent, agents.astro_lite_agent, inputs)
         next_node = 'END'
         
         if answer.tool_calls:
@@ -53,8 +159,8 @@ async def setup_workflow():
         
         return {'messages': [answer], 'message_to_user': answer.content, 'next_node': next_node}
 
-    async def taro_node(state):
-        answer = await agents.taro_agent.ainvoke({'messages': state['messages'], 'context': state['context']})
+    async def taro_node(state, config: RunnableConfig):
+        answer = await call_agent(config, agents.taro_agent, agents.taro_fast_agent, agents.taro_lite_agent, {'messages': state['messages'], 'context': state['context']})
         
         next_node = 'img_node'
         
@@ -63,25 +169,60 @@ async def setup_workflow():
         
         return {'messages': [answer], 'message_to_user': answer.content, 'next_node': next_node}
 
-    async def img_node(state):
-        answer = await agents.img_agent.ainvoke(state['message_to_user'])
+    def parsed_cards(state):
+        reading = parse_reading(state['messages'])
+        if reading is None:
+            # Без картинок ответ всё равно полезен
+            return {'next_node': 'add_memory'}
+        
+        cards, unlock_name = reading
+        return {'taro_cards': cards, 'next_node': 'add_memory', 'unlock_name': unlock_name}
+
+    async def img_node(state, config: RunnableConfig):
+        if get_tier(config) != 'full':
+            # Под нагрузкой карты берём прямо из вывода perform_reading
+            return parsed_cards(state)
+        
+        try:
+            answer = await llm_breaker.call(lambda: within(config, 'img_node', agents.img_agent.ainvoke(state['message_to_user'])))
+        except Exception:
+            return parsed_cards(state)
         
         return {'taro_cards': answer.taro_cards, 'next_node': 'add_memory', 'unlock_name': answer.unlock_name}
     
     async def add_memory(state, config: RunnableConfig):
         session_id = config['configurable']["thread_id"]
         
-        answer = await agents.summarize_agent.ainvoke({'user_message': state['user_message'], 'message_to_user': state['message_to_user']})
+        user_message, message_to_user = state['user_message'], state['message_to_user']
+        
+        # Под нагрузкой не тратим вызов LLM на пересказ
+        if get_tier(config) == 'full':
+            try:
+                answer = await llm_breaker.call(lambda: within(config, 'add_memory', agents.summarize_agent.ainvoke({'user_message': user_message, 'message_to_user': message_to_user})))
+                user_message, message_to_user = answer.user_message, answer.message_to_user
+            except Exception:
+                # Без пересказа сохраняем сообщения как есть
+                pass
         
         messages_to_save = [
-            Message(role='user', name=state['name'], content=answer.user_message),
-            Message(role='assistant', content=answer.message_to_user),
+            Message(role='user', name=state['name'], content=user_message),
+            Message(role='assistant', content=message_to_user),
         ]
         
-        await zep.thread.add_messages(
-        thread_id=session_id,
-        messages=messages_to_save,
-        )
+        async def save():
+            try:
+                await zep.thread.add_messages(thread_id=session_id, messages=messages_to_save)
+            except NotFoundError:
+                # Первый ход обогнал фоновое заведение: заводим тред сами, иначе память пропадёт,
+                # а 404 засчитается предохранителю Zep как отказ для всех пользователей
+                await ensure_thread(zep, session_id, state['name'])
+                await zep.thread.add_messages(thread_id=session_id, messages=messages_to_save)
+        
+        try:
+            await zep_breaker.call(lambda: within(config, 'zep', save()))
+        except Exception as e:
+            # Память — не то, ради чего пользователь должен ждать
+            print(f"Skipped memory for {session_id}: {e!r}")
         
         return {'next_node': 'END'}
 
@@ -96,8 +237,8 @@ async def setup_workflow():
     graph.add_node('taro_node', taro_node)
     graph.add_node('img_node', img_node)
 
-    graph.add_node('taro_tool', agents.taro_tool)
-    graph.add_node('astro_tool', agents.astro_tool)
+    graph.add_node('taro_tool', call_tools(agents.taro_tool))
+    graph.add_node('astro_tool', call_tools(agents.astro_tool))
     
     graph.add_node('take_context', take_context)
     graph.add_node('add_memory', add_memory)
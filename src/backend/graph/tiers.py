@@ -0,0 +1,84 @@
+import os
+import time
+
+from collections import Counter
+from contextlib import contextmanager
+
+from langchain_core.runnables import RunnableConfig
+
+
+# full    — как задумано: хеджирование, img_node, пересказ для памяти
+# reduced — без хеджирования и img_node (карты парсятся из вывода инструмента),
+#           память без пересказа, ответ короче
+# minimal — всё как в reduced, но агенты на быстрой модели
+TIERS = ('full', 'reduced', 'minimal')
+
+# Сколько ходов процесс обслуживает без деградации
+tier_capacity = int(os.getenv('TIER_CAPACITY', '8'))
+# Целевая длительность хода в секундах
+tier_target_latency = float(os.getenv('TIER_TARGET_LATENCY', '30'))
+# Потолок длины ответа агента на уровнях reduced и minimal
+tier_max_tokens = int(os.getenv('TIER_MAX_TOKENS', '1500'))
+
+
+class LoadMonitor:
+    """Выбирает уровень качества по текущей нагрузке.
+
+    Давление — максимум из трёх отношений: ходов в работе к `capacity`,
+    длины очереди к `capacity` и сглаженной длительности хода к
+    `target_latency`. До 1 — full, до 2 — reduced, дальше — minimal.
+    """
+
+    def __init__(self, capacity: int, target_latency: float, alpha: float = 0.2):
+        self.capacity = capacity
+        self.target_latency = target_latency
+        self.alpha = alpha
+
+        self.in_flight = 0
+        self.queue_depth = 0
+        self.latency = 0.0
+
+        self.served = Counter()
+
+    def observe_queue(self, depth: int):
+        self.queue_depth = depth
+
+    def pressure(self) -> float:
+        return max(
+            self.in_flight / self.capacity,
+            self.queue_depth / self.capacity,
+            self.latency / self.target_latency,
+        )
+
+    def current(self) -> str:
+        return TIERS[min(len(TIERS) - 1, int(self.pressure()))]
+
+    @contextmanager
+    def track(self):
+        tier = self.current()
+        self.served[tier] += 1
+        self.in_flight += 1
+        started = time.monotonic()
+
+        try:
+            yield tier
+        finally:
+            self.in_flight -= 1
+            self.latency += self.alpha * (time.monotonic() - started - self.latency)
+
+    def stats(self) -> dict:
+        return {
+            'tier': self.current(),
+            'pressure': round(self.pressure(), 2),
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'latency': round(self.latency, 2),
+            'served': dict(self.served),
+        }
+
+
+load = LoadMonitor(tier_capacity, tier_target_latency)
+
+
+def get_tier(config: RunnableConfig | None) -> str:
+    return (config or {}).get('configurable', {}).get('tier', 'full')
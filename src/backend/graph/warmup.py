@@ -0,0 +1,126 @@
+import asyncio
+import os
+import time
+
+from collections import Counter, OrderedDict
+
+from zep_cloud.errors import NotFoundError
+
+from .breaker import zep_breaker
+from .charts import charts, chart_args
+
+
+# Сколько прогревов идёт одновременно на процесс
+warm_concurrency = int(os.getenv('WARM_CONCURRENCY', '4'))
+# Повторный прогрев того же пользователя — не чаще, чем раз в столько секунд
+warm_cooldown = float(os.getenv('WARM_COOLDOWN', '120'))
+# Сколько живёт прогретый контекст Zep, если первый ход так и не пришёл
+warm_context_ttl = float(os.getenv('WARM_CONTEXT_TTL', '300'))
+# Потолок на каждый шаг прогрева
+warm_timeout = float(os.getenv('WARM_TIMEOUT', '20'))
+# Сколько пользователей держим в памяти
+warm_max_users = int(os.getenv('WARM_MAX_USERS', '1024'))
+
+
+class Warmup:
+    """Прогрев сессии при входе пользователя, до его первого хода.
+
+    Для пользователя в фоне параллельно делается три вещи: контекст Zep
+    кладётся в память (take_context заберёт его вместо запроса), натальная
+    карта досчитывается в ChartStore, если её ещё нет, а пулы соединений
+    открываются пробными запросами.
+
+    Одновременно идёт не больше `concurrency` прогревов; пока прогрев
+    пользователя идёт или прошло меньше `cooldown` секунд с прошлого,
+    повторный запрос ничего не делает.
+    """
+
+    def __init__(self, concurrency: int, cooldown: float, context_ttl: float, timeout: float, max_users: int):
+        self.concurrency = concurrency
+        self.cooldown = cooldown
+        self.context_ttl = context_ttl
+        self.timeout = timeout
+        self.max_users = max_users
+
+        # Заполняются при сборке графа; без Zep прогрев выключен
+        self.zep = None
+        self.pools = []
+
+        # user_id → (истекает, контекст)
+        self.contexts = OrderedDict()
+        # user_id → когда начат последний прогрев
+        self.warmed = OrderedDict()
+        self.tasks = {}
+
+        self._slots = None
+        self.counts = Counter()
+
+    def _remember(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_users:
+            cache.popitem(last=False)
+
+    def warm(self, user_id: str, birth_day=None, time_birth=None, city=None, country=None) -> str:
+        if self.zep is None:
+            return 'disabled'
+        if user_id in self.tasks:
+            return 'pending'
+
+        now = time.monotonic()
+        last = self.warmed.get(user_id)
+        if last is not None and now - last < self.cooldown:
+            return 'fresh'
+
+        self._remember(self.warmed, user_id, now)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.concurrency)
+
+        task = asyncio.create_task(self._warm(user_id, chart_args(birth_day, time_birth, city, country)))
+        self.tasks[user_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(user_id, None))
+        return 'started'
+
+    async def _warm(self, user_id: str, args: dict | None):
+        async with self._slots:
+            results = await asyncio.gather(
+                self._context(user_id),
+                self._chart(args),
+                *[asyncio.wait_for(ping(), self.timeout) for ping in self.pools],
+                return_exceptions=True,
+            )
+
+        for stage, result in zip(['context', 'chart'] + ['pool'] * len(self.pools), results):
+            if isinstance(result, Exception):
+                self.counts[f'{stage}_failed'] += 1
+                print(f"Warmup {stage} for {user_id} failed: {result!r}")
+            else:
+                self.counts[stage] += 1
+
+    async def _context(self, user_id: str):
+        # Новый пользователь без треда — не отказ Zep
+        memory = await zep_breaker.call(lambda: asyncio.wait_for(self.zep.thread.get_user_context(user_id), self.timeout), ignore=(NotFoundError,))
+        self._remember(self.contexts, user_id, (time.monotonic() + self.context_ttl, memory.context))
+
+    def take_context(self, user_id: str) -> str | None:
+        # Отдаётся один раз: после первого хода память в Zep уже другая
+        entry = self.contexts.pop(user_id, None)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        self.counts['context_hits'] += 1
+        return entry[1]
+
+    async def _chart(self, args: dict | None):
+        if args is not None and charts.chart_tool is not None:
+            await charts.ensure(args)
+
+    def stats(self) -> dict:
+        return {
+            'enabled': self.zep is not None,
+            'running': len(self.tasks),
+            'contexts': len(self.contexts),
+            **self.counts,
+        }
+
+
+warmup = Warmup(warm_concurrency, warm_cooldown, warm_context_ttl, warm_timeout, warm_max_users)
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import time
+
+from collections import defaultdict
+
+from schemas import Job
+
+
+class LocalBroker:
+    """Очередь задач и pub/sub в памяти процесса.
+
+    Используется, когда `BROKER_URL` не задан: API и воркеры живут в одном
+    процессе. Интерфейс тот же, что у `RedisBroker`.
+    """
+
+    def __init__(self):
+        self._jobs = asyncio.Queue()
+        self._enqueued = {}
+        self._delayed = 0
+        self._channels = defaultdict(set)
+        self._counters = defaultdict(int)
+        self._loads = {}
+
+    async def enqueue(self, job: Job):
+        self._enqueued[job.job_id] = job.enqueued_at
+
+        delay = job.not_before - time.time()
+        if delay > 0:
+            # Отложенный повтор ждёт таймер цикла, а не слот воркера
+            self._delayed += 1
+            asyncio.get_running_loop().call_later(delay, self._release, job)
+        else:
+            await self._jobs.put(job)
+
+    def _release(self, job: Job):
+        self._delayed -= 1
+        self._jobs.put_nowait(job)
+
+    async def dequeue(self) -> Job:
+        job = await self._jobs.get()
+        self._enqueued.pop(job.job_id, None)
+        return job
+
+    async def ack(self, job: Job):
+        pass
+
+    async def publish(self, channel: str, message: dict):
+        for queue in self._channels[channel]:
+            queue.put_nowait(message)
+
+    def subscribe(self, channel: str):
+        return LocalSubscription(self._channels, channel)
+
+    async def count(self, name: str):
+        self._counters[name] += 1
+
+    async def stats(self) -> dict:
+        oldest = min(self._enqueued.values(), default=None)
+        return {
+            'depth': self._jobs.qsize(),
+            'delayed': self._delayed,
+            'lag': time.time() - oldest if oldest else 0.0,
+            **self._counters,
+        }
+
+    async def report_load(self, consumer: str, stats: dict):
+        self._loads[consumer] = {**stats, 'at': time.time()}
+
+    async def loads(self, max_age: float) -> dict:
+        now = time.time()
+        return {consumer: stats for consumer, stats in self._loads.items() if now - stats['at'] <= max_age}
+
+
+class LocalSubscription:
+    def __init__(self, channels, channel: str):
+        self._channels = channels
+        self._channel = channel
+        self._queue = asyncio.Queue()
+
+    async def __aenter__(self):
+        self._channels[self._channel].add(self._queue)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._channels[self._channel].discard(self._queue)
+        if not self._channels[self._channel]:
+            del self._channels[self._channel]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        return await self._queue.get()
+
+
+class RedisBroker:
+    """Очередь задач и pub/sub в Redis — для воркеров на нескольких машинах.
+
+    Задача забирается атомарным `BLMOVE` в список `processing` конкретного
+    воркера и удаляется из него только после `ack`. Воркер с тем же
+    `consumer` после падения возвращает свои незавершённые задачи в очередь.
+    Отложенные повторы лежат в sorted set по `not_before`; воркеры перед
+    каждым ожиданием переносят созревшие задачи в очередь.
+    """
+
+    prefix = 'aitaro'
+
+    # Перенос созревших задач атомарный: задача не теряется и не дублируется между воркерами
+    PROMOTE = '''
+    local due = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, 100)
+    for _, raw in ipairs(due) do
+        redis.call('ZREM', KEYS[1], raw)
+        redis.call('LPUSH', KEYS[2], raw)
+    end
+    return #due
+    '''
+
+    def __init__(self, url: str, consumer: str = 'api'):
+        # redis нужен только в режиме с отдельными воркерами
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url, decode_responses=True)
+        self.consumer = consumer
+
+        self._queue = f'{self.prefix}:jobs'
+        self._delayed = f'{self.prefix}:delayed'
+        self._processing = f'{self.prefix}:processing:{consumer}'
+        self._counters = f'{self.prefix}:stats'
+        self._loads = f'{self.prefix}:load'
+        self._promote = self.redis.register_script(self.PROMOTE)
+
+    async def recover(self):
+        while await self.redis.lmove(self._processing, self._queue, 'RIGHT', 'RIGHT'):
+            pass
+
+    async def enqueue(self, job: Job):
+        if job.not_before > time.time():
+            await self.redis.zadd(self._delayed, {job.model_dump_json(): job.not_before})
+        else:
+            await self.redis.lpush(self._queue, job.model_dump_json())
+
+    async def dequeue(self) -> Job:
+        while True:
+            await self._promote(keys=[self._delayed, self._queue], args=[time.time()])
+            # Ждём не дольше секунды, чтобы вовремя забрать созревшие повторы
+            raw = await self.redis.blmove(self._queue, self._processing, 1, 'RIGHT', 'LEFT')
+            if raw:
+                break
+
+        job = Job.model_validate_json(raw)
+        job._raw = raw
+        return job
+
+    async def ack(self, job: Job):
+        await self.redis.lrem(self._processing, 1, job._raw)
+
+    async def publish(self, channel: str, message: dict):
+        await self.redis.publish(f'{self.prefix}:{channel}', json.dumps(message, ensure_ascii=False))
+
+    def subscribe(self, channel: str):
+        return RedisSubscription(self.redis, f'{self.prefix}:{channel}')
+
+    async def count(self, name: str):
+        await self.redis.hincrby(self._counters, name, 1)
+
+    async def stats(self) -> dict:
+        depth = await self.redis.llen(self._queue)
+        delayed = await self.redis.zcard(self._delayed)
+        oldest = await self.redis.lindex(self._queue, -1)
+        counters = await self.redis.hgetall(self._counters)
+        return {
+            'depth': depth,
+            'delayed': delayed,
+            'lag': time.time() - Job.model_validate_json(oldest).enqueued_at if oldest else 0.0,
+            **{name: int(value) for name, value in counters.items()},
+        }
+
+    async def report_load(self, consumer: str, stats: dict):
+        await self.redis.hset(self._loads, consumer, json.dumps({**stats, 'at': time.time()}))
+
+    async def loads(self, max_age: float) -> dict:
+        now = time.time()
+        loads = {consumer: json.loads(raw) for consumer, raw in (await self.redis.hgetall(self._loads)).items()}
+
+        # Остановленные воркеры больше не отчитываются — убираем их из списка
+        stale = [consumer for consumer, stats in loads.items() if now - stats['at'] > max_age]
+        if stale:
+            await self.redis.hdel(self._loads, *stale)
+        return {consumer: stats for consumer, stats in loads.items() if consumer not in stale}
+
+
+class RedisSubscription:
+    def __init__(self, redis, channel: str):
+        self._pubsub = redis.pubsub()
+        self._channel = channel
+
+    async def __aenter__(self):
+        await self._pubsub.subscribe(self._channel)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._pubsub.unsubscribe(self._channel)
+        await self._pubsub.aclose()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> dict:
+        while True:
+            message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=None)
+            if message:
+                return json.loads(message['data'])
+
+
+def create_broker(url: str | None, consumer: str = 'api'):
+    if url:
+        return RedisBroker(url, consumer)
+    return LocalBroker()
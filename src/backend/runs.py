@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import time
+import uuid
+
+from collections import deque
+
+
+class RunFailed(Exception):
+    """Граф упал: подписчик дочитал события и получает ошибку вместо конца потока."""
+
+
+class Run:
+    """Один запуск графа, на события которого могут подписаться несколько клиентов.
+
+    События лежат в кольцевом буфере на `buffer_size` элементов и нумеруются
+    с 1. Клиент, потерявший соединение, переподключается с курсором — номером
+    последнего полученного события — и получает только то, что пропустил.
+    Если клиентов не осталось, граф доживает `grace` секунд в фоне и только
+    потом отменяется. Если граф упал, поток каждого подписчика кончается
+    исключением RunFailed, а не обычным концом.
+    """
+
+    def __init__(self, run_id: str, user_id: str, fingerprint: str, buffer_size: int = 64, grace: float = 30):
+        self.run_id = run_id
+        self.user_id = user_id
+        self.fingerprint = fingerprint
+        self.grace = grace
+
+        self.events = deque(maxlen=buffer_size)
+        self.last_seq = 0
+        self.done = False
+        self.error = None
+        self.finished_at = None
+
+        self.subscribers = 0
+        self.task = None
+
+        self._changed = asyncio.Condition()
+        self._reaper = None
+
+    async def publish(self, event):
+        async with self._changed:
+            self.last_seq += 1
+            self.events.append((self.last_seq, event))
+            self._changed.notify_all()
+
+    async def finish(self, error: str | None = None):
+        async with self._changed:
+            self.done = True
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._changed.notify_all()
+
+    def cancel(self):
+        if self.task and not self.done:
+            self.task.cancel()
+
+    def _expire(self):
+        self._reaper = None
+        if not self.subscribers:
+            self.cancel()
+
+    async def subscribe(self, cursor: int = 0):
+        """Отдаёт пары `(seq, event)` начиная с события после `cursor`.
+
+        Если нужные события уже вытеснены из буфера, поток продолжается с
+        самого старого из оставшихся — в режиме `values` каждое событие несёт
+        полное состояние, так что клиент ничего не теряет.
+        """
+        self.subscribers += 1
+        if self._reaper:
+            self._reaper.cancel()
+            self._reaper = None
+
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: self.last_seq > cursor or self.done)
+                    pending = [(seq, event) for seq, event in self.events if seq > cursor]
+                    done = self.done
+
+                for seq, event in pending:
+                    cursor = seq
+                    yield seq, event
+
+                if done and cursor >= self.last_seq:
+                    if self.error is not None:
+                        raise RunFailed(self.error)
+                    return
+        finally:
+            self.subscribers -= 1
+            # Клиент мог просто потерять сеть — даём ему время вернуться
+            if not self.subscribers and not self.done and self.task:
+                self._reaper = asyncio.get_running_loop().call_later(self.grace, self._expire)
+
+
+class RunRegistry:
+    """Склеивает повторные отправки одного сообщения в один запуск графа.
+
+    Запуск ищется по `(user_id, request_id)`, а пока он идёт — ещё и по
+    `(user_id, message)`, чтобы двойной клик без нового ID не запускал граф
+    второй раз. Завершённые запуски хранятся `replay_ttl` секунд для повтора
+    и докачки по курсору.
+    """
+
+    def __init__(self, replay_ttl: float = 60, buffer_size: int = 64, grace: float = 30):
+        self.replay_ttl = replay_ttl
+        self.buffer_size = buffer_size
+        self.grace = grace
+
+        self._by_request = {}
+        self._in_flight = {}
+
+    @staticmethod
+    def fingerprint(message: str) -> str:
+        return hashlib.sha256(message.encode()).hexdigest()
+
+    def _purge(self):
+        now = time.monotonic()
+        expired = [
+            key for key, run in self._by_request.items()
+            if run.done and now - run.finished_at > self.replay_ttl
+        ]
+        for key in expired:
+            del self._by_request[key]
+
+    def stats(self) -> dict:
+        return {
+            'in_flight': len(self._in_flight),
+            'tracked': len(self._by_request),
+        }
+
+    def get(self, user_id: str, run_id: str) -> Run | None:
+        self._purge()
+        return self._by_request.get((user_id, run_id))
+
+    def get_or_start(self, user_id: str, request_id: str | None, message: str, producer) -> Run:
+        """Возвращает уже идущий (или недавно завершённый) запуск либо стартует новый.
+
+        `producer` — фабрика асинхронного генератора событий, вызывается только
+        для нового запуска.
+        """
+        self._purge()
+
+        request_id = request_id or uuid.uuid4().hex
+        fingerprint = self.fingerprint(message)
+
+        run = self._by_request.get((user_id, request_id))
+        if run:
+            return run
+
+        run = self._in_flight.get((user_id, fingerprint))
+        if run:
+            self._by_request[(user_id, request_id)] = run
+            return run
+
+        run = Run(request_id, user_id, fingerprint, self.buffer_size, self.grace)
+        self._by_request[(user_id, request_id)] = run
+        self._in_flight[(user_id, fingerprint)] = run
+        run.task = asyncio.create_task(self._drive(run, producer))
+
+        return run
+
+    def _forget(self, run: Run):
+        # Оборванный или упавший запуск не годится для повтора — следующая отправка начнёт заново
+        for key in [key for key, value in self._by_request.items() if value is run]:
+            del self._by_request[key]
+
+    async def _drive(self, run: Run, producer):
+        error = None
+        try:
+            async for event in producer():
+                await run.publish(event)
+        except asyncio.CancelledError:
+            self._forget(run)
+        except Exception as e:
+            print(f"Run {run.run_id} failed: {e!r}")
+            error = str(e) or type(e).__name__
+            self._forget(run)
+        finally:
+            self._in_flight.pop((run.user_id, run.fingerprint), None)
+            # Подписчики, уже ждущие запуск, получат ошибку; новые его не найдут
+            await run.finish(error)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, PrivateAttr
 from typing import Optional, Literal, List
 
 class TaroCard(BaseModel):
@@ -10,6 +10,10 @@ class ExtractData(BaseModel):
     taro_cards: Optional[List[TaroCard]] = None
     next_node: Optional[Literal['astro_node', 'taro_node', 'astro_tool', 'taro_tool', 'router_node','img_node', 'add_memory', 'END']] = 'router_node'
     unlock_name: Optional[str] = None
+    tier: Optional[Literal['full', 'reduced', 'minimal']] = None
+    
+    seq: Optional[int] = None
+    run_id: Optional[str] = None
     
     class Config:
         extra = "ignore"
@@ -17,9 +21,47 @@ class ExtractData(BaseModel):
 class UserData(BaseModel):
     message: str
     user_id: str
+    request_id: Optional[str] = None
+    timeout: Optional[float] = None
     
     birth_day: str
     time_birth: str
     city: str
     country: str
-    name: str
\ No newline at end of file
+    name: str
+    
+class ProfileData(BaseModel):
+    user_id: str
+    
+    # Профиль из БД фронтенда; без него натальная карта не считается
+    birth_day: Optional[str] = None
+    time_birth: Optional[str] = None
+    city: Optional[str] = None
+    country: Optional[str] = None
+    
+class SpreadSlot(BaseModel):
+    # Проценты от ширины/высоты контейнера, как в разметке фронтенда
+    top: float
+    left: float
+    width: float
+    aspect: float = 2 / 3
+    rotate: int = 0
+    z: int = 0
+    
+class SpreadImageRequest(BaseModel):
+    spread: str
+    cards: List[TaroCard]
+    max_width: int = Field(..., gt=0, le=2000)
+    aspect: float = Field(..., gt=0)
+    slots: List[SpreadSlot]
+    
+class Job(BaseModel):
+    job_id: str
+    item: UserData
+    attempt: int = 0
+    enqueued_at: float
+    # Повтор после сбоя: раньше этого времени (time.time) задачу не берём
+    not_before: float = 0.0
+    
+    # исходная строка из очереди, нужна брокеру для подтверждения
+    _raw: Optional[str] = PrivateAttr(None)
\ No newline at end of file
@@ -0,0 +1,29 @@
+from dotenv import load_dotenv
+import os
+
+load_dotenv()
+
+# inline — граф выполняется прямо в процессе API,
+# queue  — API ставит задачу в очередь, граф выполняют воркеры (worker.py)
+graph_mode = os.getenv('GRAPH_MODE', 'inline')
+
+# redis://... — общая очередь для воркеров на разных машинах,
+# пусто — очередь в памяти процесса API (локальный запуск и тесты)
+broker_url = os.getenv('BROKER_URL')
+
+# Сквозной дедлайн хода в секундах; клиент может попросить меньше, но не больше
+request_timeout = float(os.getenv('REQUEST_TIMEOUT', '90'))
+
+graph_workers = int(os.getenv('GRAPH_WORKERS', '4'))
+job_retries = int(os.getenv('JOB_RETRIES', '2'))
+# Как часто воркер смотрит длину очереди и публикует свою нагрузку для /metrics
+load_report_interval = float(os.getenv('LOAD_REPORT_INTERVAL', '5'))
+
+# Картинки карт: собираются `python assets.py`, отдаются по /cards
+assets_dir = os.getenv('ASSETS_DIR', os.path.join(os.path.dirname(__file__), 'static', 'cards'))
+assets_source = os.getenv('ASSETS_SOURCE', 'https://github.com/KopatychDisko/tarot_images/blob/main/images/{slug}.jpeg?raw=true')
+
+# Готовые картинки раскладов: каталог, предел размера и число процессов-рендеров
+spreads_dir = os.getenv('SPREADS_DIR', os.path.join(os.path.dirname(__file__), 'static', 'spreads'))
+spreads_cache_bytes = int(os.getenv('SPREADS_CACHE_MB', '256')) * 1024 * 1024
+spread_workers = int(os.getenv('SPREAD_WORKERS', '2'))
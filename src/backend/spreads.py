@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import math
+import multiprocessing
+import os
+import re
+
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from assets import pick_size
+from schemas import SpreadImageRequest
+
+# Меняется вместе с алгоритмом сборки — старые картинки перестают совпадать по ключу
+COMPOSITOR_VERSION = 1
+# Рисуем с запасом для HiDPI-экранов
+SCALE = 2
+
+FILENAME = re.compile(r'^[0-9a-f]{32}\.webp$')
+
+
+def spread_key(request: SpreadImageRequest) -> str:
+    # Расклад, карты по порядку, ориентации и разметка однозначно задают картинку
+    payload = f'{COMPOSITOR_VERSION}:{request.model_dump_json()}'
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+def compose(path: str, max_width: int, aspect: float, slots: list[dict], cards: list[tuple[str, bool]]):
+    """Собирает расклад в одну WebP-картинку. Выполняется в процессе пула."""
+    from PIL import Image, ImageOps
+
+    width = max_width * SCALE
+    height = width / aspect
+
+    boxes = []
+    for slot, (source, reversed) in zip(slots, cards):
+        w = slot['width'] / 100 * width
+        h = w / slot['aspect']
+        x = slot['left'] / 100 * width
+        y = slot['top'] / 100 * height
+        # Как transform в CSS: по часовой стрелке вокруг центра карты
+        angle = (slot['rotate'] + (180 if reversed else 0)) % 360
+        boxes.append((slot['z'], x, y, w, h, angle, source))
+
+    # Холст охватывает и контейнер, и вылезающие за него (в том числе повёрнутые) карты
+    left, top, right, bottom = 0.0, 0.0, width, height
+    for _, x, y, w, h, angle, _ in boxes:
+        bw, bh = (h, w) if angle in (90, 270) else (w, h)
+        center_x, center_y = x + w / 2, y + h / 2
+        left, top = min(left, center_x - bw / 2), min(top, center_y - bh / 2)
+        right, bottom = max(right, center_x + bw / 2), max(bottom, center_y + bh / 2)
+
+    canvas = Image.new('RGBA', (math.ceil(right - left), math.ceil(bottom - top)), (0, 0, 0, 0))
+
+    for _, x, y, w, h, angle, source in sorted(boxes, key=lambda box: box[0]):
+        with Image.open(source) as image:
+            card = ImageOps.contain(image.convert('RGBA'), (max(1, round(w)), max(1, round(h))))
+        if angle:
+            card = card.rotate(-angle, expand=True, resample=Image.Resampling.BICUBIC)
+
+        center_x, center_y = x + w / 2 - left, y + h / 2 - top
+        canvas.paste(card, (round(center_x - card.width / 2), round(center_y - card.height / 2)), card)
+
+    temp = f'{path}.{os.getpid()}.tmp'
+    canvas.save(temp, 'WEBP', quality=80, method=4)
+    os.replace(temp, path)
+    return os.path.getsize(path)
+
+
+class SpreadStore:
+    """Кеш собранных раскладов на диске с вытеснением по размеру.
+
+    Имя файла — ключ запроса, поэтому файл никогда не меняется и отдаётся
+    с бессрочным кешированием. Сборка идёт в пуле процессов, одинаковые
+    одновременные запросы ждут одну сборку. При превышении `max_bytes`
+    удаляются давно не запрошенные картинки, но запрос рядом с ними
+    (`<ключ>.json`, сотни байт) остаётся: ссылка из сохранённой истории
+    по-прежнему открывается, картинка просто собирается заново.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, workers: int, assets):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self.assets = assets
+
+        self._pool = None
+        self._pending = {}
+        self._index = OrderedDict()
+        self._size = 0
+
+        os.makedirs(directory, exist_ok=True)
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith('.webp')]
+        for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+            self._index[entry.name] = entry.stat().st_size
+            self._size += entry.stat().st_size
+
+        self.hits = 0
+        self.renders = 0
+
+    def _request_path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename.removesuffix('.webp') + '.json')
+
+    async def file(self, filename: str) -> str | None:
+        """Путь к картинке; вытесненная собирается заново по сохранённому запросу."""
+        if not FILENAME.match(filename):
+            return None
+
+        if filename in self._index:
+            self._index.move_to_end(filename)
+            return os.path.join(self.directory, filename)
+
+        try:
+            with open(self._request_path(filename), encoding='utf-8') as f:
+                request = SpreadImageRequest.model_validate_json(f.read())
+        except (OSError, ValueError):
+            return None
+
+        # Запрос от старой версии сборщика даст другой ключ — такую картинку не подменяем
+        if f'{spread_key(request)}.webp' != filename:
+            return None
+
+        try:
+            return os.path.join(self.directory, await self.get(request))
+        except KeyError:
+            return None
+
+    async def get(self, request: SpreadImageRequest) -> str:
+        """Имя файла с картинкой расклада; KeyError, если карт нет в хранилище."""
+        filename = f'{spread_key(request)}.webp'
+
+        if filename in self._index:
+            self.hits += 1
+            self._index.move_to_end(filename)
+            return filename
+
+        if filename not in self._pending:
+            self._pending[filename] = asyncio.ensure_future(self._render(filename, request))
+            self._pending[filename].add_done_callback(lambda _: self._pending.pop(filename, None))
+
+        return await asyncio.shield(self._pending[filename])
+
+    async def _render(self, filename: str, request: SpreadImageRequest) -> str:
+        # Исходник не больше, чем займёт карта на холсте: мелкие места раскладов не декодируют lg
+        sources = [
+            self.assets.variant(card.name, pick_size(slot.width / 100 * request.max_width * SCALE))
+            for card, slot in zip(request.cards, request.slots)
+        ]
+        missing = [card.name for card, source in zip(request.cards, sources) if source is None]
+        if missing:
+            raise KeyError(', '.join(missing))
+
+        if self._pool is None:
+            # spawn, а не fork: процесс API многопоточный и с работающим event loop
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+        slots = [slot.model_dump() for slot in request.slots]
+        cards = [(source, card.reversed) for source, card in zip(sources, request.cards)]
+
+        with open(self._request_path(filename), 'w', encoding='utf-8') as f:
+            f.write(request.model_dump_json())
+
+        size = await asyncio.get_running_loop().run_in_executor(
+            self._pool, compose, os.path.join(self.directory, filename), request.max_width, request.aspect, slots, cards
+        )
+
+        self.renders += 1
+        self._index[filename] = size
+        self._size += size
+        self._evict()
+        return filename
+
+    def _evict(self):
+        # Последнюю добавленную не трогаем, даже если она одна больше лимита
+        while self._size > self.max_bytes and len(self._index) > 1:
+            filename, size = self._index.popitem(last=False)
+            self._size -= size
+            try:
+                os.remove(os.path.join(self.directory, filename))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> dict:
+        return {'files': len(self._index), 'bytes': self._size, 'hits': self.hits, 'renders': self.renders}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
@@ -0,0 +1,192 @@
+import asyncio
+import os
+import socket
+import time
+import uuid
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+
+from schemas import ExtractData, Job, UserData
+from jobs import create_broker
+from graph.deadline import Deadline
+from graph.tiers import load
+import settings
+
+
+async def run_workflow(workflow, item: UserData, started_at: float | None = None):
+    # Дедлайн считается от приёма запроса, время в очереди тоже входит в бюджет
+    deadline = Deadline(min(item.timeout or settings.request_timeout, settings.request_timeout), started_at)
+    
+    with load.track() as tier:
+        async for data in _stream(workflow, item, deadline, tier):
+            yield data
+
+
+async def _stream(workflow, item: UserData, deadline: Deadline, tier: str):
+    config = RunnableConfig(
+        configurable={
+            "thread_id": item.user_id,
+            "deadline": deadline,
+            "tier": tier
+        }
+    )
+
+    info = {
+        'messages': [HumanMessage(item.message)],
+        'next_node': 'router_node',
+        'birth_day': item.birth_day,
+        'city': item.city,
+        'country': item.country,
+        'time_birth': item.time_birth,
+        'name': item.name,
+        'tier': tier
+    }
+
+    async for chunk in workflow.astream(input=info,
+                                 stream_mode='values', config=config):
+        if chunk.get('taro_cards'):
+            chunk['taro_cards'] = [card.model_dump() for card in chunk.get('taro_cards')]
+
+        yield ExtractData.model_validate(chunk)
+
+
+async def submit_job(broker, item: UserData):
+    """Ставит ход в очередь и отдаёт события, которые публикует воркер."""
+    job = Job(job_id=uuid.uuid4().hex, item=item, enqueued_at=time.time())
+    finished = False
+
+    # Подписываемся до постановки в очередь, чтобы не пропустить первые события
+    async with broker.subscribe(f'events:{job.job_id}') as events:
+        await broker.enqueue(job)
+
+        try:
+            async for message in events:
+                if message['type'] == 'event':
+                    yield ExtractData.model_validate(message['data'])
+                elif message['type'] == 'error':
+                    finished = True
+                    raise RuntimeError(message['detail'])
+                elif message['type'] == 'done':
+                    finished = True
+                    return
+        finally:
+            if not finished:
+                # Ход больше никому не нужен — освобождаем воркер
+                await broker.publish(f'control:{job.job_id}', {'type': 'cancel'})
+
+
+class GraphWorker:
+    """Пул корутин, выполняющих граф для задач из очереди.
+
+    Упавшая задача возвращается в очередь с экспоненциальной задержкой до
+    `retries` раз, после чего клиент получает `error`. Повторяется только
+    ход, который ещё не опубликовал ни одного события: иначе клиент увидел
+    бы события дважды, а память в Zep записалась бы повторно. Задержку
+    держит брокер (`not_before`), а не слот воркера.
+    """
+
+    def __init__(self, broker, workflow, concurrency: int, retries: int, backoff: float = 1.0,
+                 consumer: str = 'local', report_interval: float = settings.load_report_interval):
+        self.broker = broker
+        self.workflow = workflow
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.consumer = consumer
+        self.report_interval = report_interval
+
+    async def run(self):
+        await asyncio.gather(self._report(), *[self._loop() for _ in range(self.concurrency)])
+
+    async def _report(self):
+        # Длина очереди — часть давления, по которому выбирается уровень качества.
+        # Снимается раз в интервал, а не на каждую задачу: stats() у Redis — несколько запросов.
+        # Уровень выбирает воркер, поэтому и в /metrics его нагрузку публикует он сам
+        while True:
+            try:
+                load.observe_queue((await self.broker.stats())['depth'])
+                await self.broker.report_load(self.consumer, load.stats())
+            except Exception as e:
+                print(f"Load report of {self.consumer} failed: {e!r}")
+            await asyncio.sleep(self.report_interval)
+
+    async def _loop(self):
+        while True:
+            job = await self.broker.dequeue()
+            # Без ack задача, прерванная остановкой воркера, вернётся в очередь при recover()
+            await self._process(job)
+            await self.broker.ack(job)
+
+    async def _process(self, job: Job):
+        channel = f'events:{job.job_id}'
+        # Сколько событий уже ушло клиенту — от этого зависит, можно ли повторять ход
+        published = [0]
+
+        async with self.broker.subscribe(f'control:{job.job_id}') as control:
+            task = asyncio.create_task(self._execute(job, channel, published))
+            watcher = asyncio.create_task(self._watch(control, task))
+
+            try:
+                await asyncio.wait([task])
+            finally:
+                watcher.cancel()
+                if not task.done():
+                    task.cancel()
+
+        if task.cancelled():
+            await self.broker.count('cancelled')
+            return
+
+        if task.exception() is None:
+            await self.broker.count('processed')
+            await self.broker.publish(channel, {'type': 'done'})
+            return
+
+        error = task.exception()
+        print(f"Job {job.job_id} attempt {job.attempt} failed: {error}")
+
+        if job.attempt < self.retries and not published[0]:
+            await self.broker.count('retried')
+            await self.broker.enqueue(job.model_copy(update={
+                'attempt': job.attempt + 1,
+                'not_before': time.time() + self.backoff * 2 ** job.attempt,
+            }))
+        else:
+            await self.broker.count('failed')
+            await self.broker.publish(channel, {'type': 'error', 'detail': str(error)})
+
+    async def _execute(self, job: Job, channel: str, published: list):
+        async for data in run_workflow(self.workflow, job.item, job.enqueued_at):
+            await self.broker.publish(channel, {'type': 'event', 'data': data.model_dump(mode='json')})
+            published[0] += 1
+
+    async def _watch(self, control, task):
+        async for message in control:
+            if message['type'] == 'cancel':
+                task.cancel()
+                return
+
+
+async def main():
+    from graph import setup_workflow
+
+    if not settings.broker_url:
+        raise SystemExit('BROKER_URL is required to run graph workers in a separate process')
+    if not os.getenv('CHARTS_DIR'):
+        # Карту считает тот воркер, которому достался ход; без общего каталога
+        # каждый воркер пересчитывал бы её на своём первом астро-ходе
+        raise SystemExit('CHARTS_DIR must point to a directory shared by all graph workers')
+
+    consumer = os.getenv('WORKER_ID', socket.gethostname())
+    broker = create_broker(settings.broker_url, consumer)
+    await broker.recover()
+
+    workflow = await setup_workflow()
+    print(f"Graph worker {consumer} started with {settings.graph_workers} slots")
+
+    await GraphWorker(broker, workflow, settings.graph_workers, settings.job_retries, consumer=consumer).run()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
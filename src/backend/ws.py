@@ -0,0 +1,185 @@
+import asyncio
+import json
+
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from runs import RunFailed
+from schemas import UserData
+
+
+class ChatSession:
+    """Долгоживущее WebSocket-соединение одного чата.
+
+    Клиент шлёт JSON-сообщения с полем `type`:
+        turn   — новый ход (поля UserData без user_id, плюс request_id)
+        cancel — отписаться от хода по request_id; сам граф остановится,
+                 только если на запуск больше никто не подписан (через grace)
+        typing — пользователь печатает (принимается, но пока не используется)
+        ping   — ответить pong
+
+    Бинарные кадры не поддерживаются: соединение закрывается с кодом 1003.
+
+    Сервер отвечает `event` (состояние агента с request_id и seq), `done`,
+    `error`, `cancelled`, `pong` и раз в `heartbeat` секунд шлёт `ping`. Соединение, от
+    которого ничего не приходило `idle_timeout` секунд, закрывается.
+
+    Исходящие сообщения идут через очередь на `max_queued` элементов: если
+    клиент читает медленно, подписки на ходы ждут, а граф продолжает писать
+    в кольцевой буфер запуска. Для ограничения памяти на соединение заданы
+    лимит размера входящего сообщения, числа одновременных ходов и объёма
+    неотправленных данных.
+    """
+
+    def __init__(self, websocket: WebSocket, user_id: str, runs, producer,
+                 heartbeat: float = 20, idle_timeout: float = 60,
+                 max_turns: int = 2, max_queued: int = 32,
+                 max_message_bytes: int = 16 * 1024, max_buffered_bytes: int = 1024 * 1024):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.runs = runs
+        self.producer = producer
+
+        self.heartbeat = heartbeat
+        self.idle_timeout = idle_timeout
+        self.max_turns = max_turns
+        self.max_message_bytes = max_message_bytes
+        self.max_buffered_bytes = max_buffered_bytes
+
+        self.outbox = asyncio.Queue(maxsize=max_queued)
+        self.buffered_bytes = 0
+
+        self.turns = {}
+
+        self.closed = asyncio.Event()
+        self.close_code = 1000
+        self.close_reason = ''
+
+    def close(self, code: int, reason: str):
+        if not self.closed.is_set():
+            self.close_code, self.close_reason = code, reason
+            self.closed.set()
+
+    async def serve(self):
+        await self.websocket.accept()
+
+        reader = asyncio.create_task(self._read())
+        closer = asyncio.create_task(self.closed.wait())
+        tasks = [reader, closer, asyncio.create_task(self._write()), asyncio.create_task(self._ping())]
+
+        try:
+            # Соединение живёт, пока его не закрыл клиент или мы сами
+            await asyncio.wait([reader, closer], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in [*tasks, *self.turns.values()]:
+                task.cancel()
+
+        if self.closed.is_set():
+            try:
+                await self.websocket.close(code=self.close_code, reason=self.close_reason)
+            except RuntimeError:
+                pass
+
+    async def _read(self):
+        while True:
+            try:
+                frame = await asyncio.wait_for(self.websocket.receive(), self.idle_timeout)
+            except asyncio.TimeoutError:
+                self.close(1001, 'Idle timeout')
+                return
+            except (WebSocketDisconnect, RuntimeError):
+                return
+
+            if frame['type'] == 'websocket.disconnect':
+                return
+
+            raw = frame.get('text')
+            if raw is None:
+                self.close(1003, 'Binary frames are not supported')
+                return
+
+            if len(raw) > self.max_message_bytes:
+                self.close(1009, 'Message too big')
+                return
+
+            try:
+                message = json.loads(raw)
+            except json.JSONDecodeError:
+                await self.send({'type': 'error', 'detail': 'Invalid JSON'})
+                continue
+
+            kind = message.get('type')
+
+            if kind == 'turn':
+                await self._start_turn(message)
+            elif kind == 'cancel':
+                await self._cancel_turn(message.get('request_id'))
+            elif kind == 'ping':
+                await self.send({'type': 'pong'})
+            elif kind not in ('pong', 'typing'):
+                await self.send({'type': 'error', 'detail': f'Unknown message type: {kind}'})
+
+    async def _start_turn(self, message: dict):
+        try:
+            item = UserData.model_validate({**message, 'user_id': self.user_id})
+        except ValidationError as e:
+            await self.send({'type': 'error', 'detail': e.errors(include_url=False)})
+            return
+
+        # Повтор того же request_id: события уже идут клиенту, вторая подписка не нужна
+        pump = self.turns.get(item.request_id)
+        if pump is not None and not pump.done():
+            return
+
+        active = [task for task in self.turns.values() if not task.done()]
+        if len(active) >= self.max_turns:
+            await self.send({'type': 'error', 'request_id': item.request_id, 'detail': 'Too many turns in flight'})
+            return
+
+        run = self.runs.get_or_start(item.user_id, item.request_id, item.message, lambda: self.producer(item))
+        pump = self.turns.get(run.run_id)
+        if pump is None or pump.done():
+            self.turns[run.run_id] = asyncio.create_task(self._pump(run))
+
+    async def _cancel_turn(self, request_id: str | None):
+        # Запуск общий для всех, кого склеил RunRegistry: отменяем только свою подписку
+        run = self.runs.get(self.user_id, request_id) if request_id else None
+        pump = self.turns.pop(run.run_id, None) if run else None
+        if pump is not None and not pump.done():
+            pump.cancel()
+            await self.send({'type': 'cancelled', 'request_id': run.run_id})
+
+    async def _pump(self, run):
+        try:
+            async for seq, data in run.subscribe():
+                await self.send({'type': 'event', 'request_id': run.run_id, 'seq': seq, 'data': data.model_dump(mode='json')})
+        except RunFailed as e:
+            await self.send({'type': 'error', 'request_id': run.run_id, 'detail': str(e)})
+        else:
+            await self.send({'type': 'done', 'request_id': run.run_id})
+        self.turns.pop(run.run_id, None)
+
+    async def send(self, payload: dict):
+        text = json.dumps(payload, ensure_ascii=False)
+
+        if self.buffered_bytes + len(text) > self.max_buffered_bytes:
+            self.close(1008, 'Client is too slow')
+            return
+
+        self.buffered_bytes += len(text)
+        await self.outbox.put(text)
+
+    async def _write(self):
+        while True:
+            text = await self.outbox.get()
+            try:
+                await self.websocket.send_text(text)
+            except (WebSocketDisconnect, RuntimeError):
+                self.close(1001, 'Connection lost')
+                return
+            self.buffered_bytes -= len(text)
+
+    async def _ping(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            await self.send({'type': 'ping'})
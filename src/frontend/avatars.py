@@ -0,0 +1,185 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import streamlit as st
+from dotenv import load_dotenv
+
+from clients import create_web_client
+
+load_dotenv()
+
+# Миниатюры аватаров на диске общие для всех процессов Streamlit на машине
+AVATAR_CACHE_DIR = Path(os.getenv('AVATAR_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ai_taro_avatars')))
+AVATAR_CACHE_BYTES = int(os.getenv('AVATAR_CACHE_MB', '64')) * 1024 * 1024
+# Через сколько секунд аватар скачивается заново
+AVATAR_TTL = float(os.getenv('AVATAR_TTL', '86400'))
+AVATAR_MEMORY_ITEMS = int(os.getenv('AVATAR_MEMORY_ITEMS', '512'))
+# Сторона миниатюры: аватар в чате ~40 px, запас на HiDPI
+AVATAR_SIZE = int(os.getenv('AVATAR_SIZE', '96'))
+# Через сколько секунд повторяем загрузку аватара, которая не удалась
+AVATAR_RETRY = float(os.getenv('AVATAR_RETRY', '300'))
+
+
+def thumbnail(data: bytes, size: int) -> bytes:
+    # Квадратная PNG-миниатюра; без Pillow храним как есть
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return data
+
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.fit(image.convert('RGBA'), (size, size), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, 'PNG', optimize=True)
+        return out.getvalue()
+
+
+class AvatarCache:
+    """Аватары по URL: LRU в памяти поверх каталога на диске.
+
+    `get` никогда не ждёт сеть: если миниатюры нет или она старше `ttl`,
+    загрузка уходит в фоновый поток, а вызывающий получает то, что есть
+    (устаревшую миниатюру или None) и показывает аватар по умолчанию до
+    следующего перезапуска страницы. Неудачная загрузка запоминается, и
+    следующая попытка для этого URL будет не раньше чем через `retry` секунд.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, ttl: float, memory_items: int, size: int,
+                 retry: float, client):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory_items = memory_items
+        self.size = size
+        self.retry = retry
+        self.client = client
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        # url → (миниатюра, время загрузки)
+        self.memory: OrderedDict[str, tuple[bytes, float]] = OrderedDict()
+        self.pending: set[str] = set()
+        # url → когда можно попробовать снова
+        self.failed: OrderedDict[str, float] = OrderedDict()
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='avatars')
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def _path(self, url: str) -> Path:
+        return self.directory / f'{hashlib.sha256(url.encode()).hexdigest()}.png'
+
+    def _remember(self, url: str, data: bytes, fetched: float):
+        self.memory[url] = (data, fetched)
+        self.memory.move_to_end(url)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def get(self, url: str) -> bytes | None:
+        now = time.time()
+
+        with self.lock:
+            entry = self.memory.get(url)
+            if entry is not None:
+                self.memory.move_to_end(url)
+                self.hits += 1
+            else:
+                path = self._path(url)
+                try:
+                    entry = (path.read_bytes(), path.stat().st_mtime)
+                    self._remember(url, *entry)
+                    self.disk_hits += 1
+                except OSError:
+                    self.misses += 1
+
+            if entry is None or now - entry[1] > self.ttl:
+                self._schedule(url)
+
+        return entry[0] if entry else None
+
+    def _schedule(self, url: str):
+        # Под self.lock: одна загрузка на URL, сколько бы сессий его ни ждали
+        if url in self.pending or self.failed.get(url, 0) > time.monotonic():
+            return
+        self.pending.add(url)
+        self.pool.submit(self._fetch, url)
+
+    def _fetch(self, url: str):
+        try:
+            response = self.client.get(url)
+            data = thumbnail(response.raise_for_status().content, self.size)
+
+            path = self._path(url)
+            tmp = path.with_suffix('.tmp')
+            tmp.write_bytes(data)
+            tmp.replace(path)
+
+            with self.lock:
+                self._remember(url, data, time.time())
+                self.failed.pop(url, None)
+            self._evict()
+        except Exception as e:
+            with self.lock:
+                self.failures += 1
+                self.failed[url] = time.monotonic() + self.retry
+                self.failed.move_to_end(url)
+                while len(self.failed) > self.memory_items:
+                    self.failed.popitem(last=False)
+            print(f"Error loading avatar: {e}")
+        finally:
+            with self.lock:
+                self.pending.discard(url)
+
+    def _evict(self):
+        # Старые по mtime файлы уходят, пока каталог не влезет в лимит
+        files = []
+        for path in self.directory.glob('*.png'):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'memory': len(self.memory),
+                'pending': len(self.pending),
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'failures': self.failures,
+                'failed': len(self.failed),
+            }
+
+
+@st.cache_resource
+def get_avatar_cache() -> AvatarCache:
+    return AvatarCache(AVATAR_CACHE_DIR, AVATAR_CACHE_BYTES, AVATAR_TTL, AVATAR_MEMORY_ITEMS, AVATAR_SIZE,
+                       AVATAR_RETRY, create_web_client())
+
+
+def user_avatar():
+    # Миниатюра аватара Google или None — тогда Streamlit рисует значок по умолчанию
+    url = getattr(st.user, 'picture', None) if hasattr(st, 'user') else None
+    if not url:
+        return None
+    return get_avatar_cache().get(url)
@@ -0,0 +1,42 @@
+"""Микробенчмарк движка раскладов: python bench_layouts.py
+
+Для каждого расклада меряет сборку HTML без кеша (разметка уже
+скомпилирована) и повторный вызов с теми же картами — так при rerun
+Streamlit перерисовывается уже показанный расклад.
+"""
+import random
+import timeit
+
+from layouts import SPREAD_LAYOUTS
+from templates import compile_layout, spread_html
+
+NAMES = [
+    'thefool', 'themagician', 'thehighpriestess', 'theempress', 'theemperor', 'thehierophant', 'thelovers',
+    'thechariot', 'strength', 'thehermit', 'wheeloffortune', 'justice', 'thehangedman', 'death',
+    'temperance', 'thedevil', 'thetower', 'thestar', 'themoon', 'thesun', 'judgement', 'theworld',
+]
+
+NUMBER = 2000
+
+
+def main():
+    random.seed(0)
+    print(f"{'spread':<20}{'cards':>6}{'cold, us':>12}{'memo, us':>12}{'html, KB':>10}")
+
+    for name, layout in SPREAD_LAYOUTS.items():
+        cards = tuple((random.choice(NAMES), random.random() < 0.5) for _ in layout.slots)
+        compile_layout(name)
+
+        def cold():
+            spread_html.cache_clear()
+            spread_html(name, cards)
+
+        cold_us = timeit.timeit(cold, number=NUMBER) / NUMBER * 1e6
+        memo_us = timeit.timeit(lambda: spread_html(name, cards), number=NUMBER) / NUMBER * 1e6
+        size = len(spread_html(name, cards)) / 1024
+
+        print(f"{name:<20}{len(layout.slots):>6}{cold_us:>12.1f}{memo_us:>12.2f}{size:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
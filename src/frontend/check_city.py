@@ -1,10 +1,16 @@
-from geopy.geocoders import Nominatim
-import pycountry
+import streamlit as st
 
-geolocator = Nominatim(user_agent="geo_checker", timeout=10)
+
+@st.cache_resource
+def get_geolocator():
+    # geopy нужен только на форме профиля — импортируем при первом использовании
+    from geopy.geocoders import Nominatim
+    return Nominatim(user_agent="geo_checker", timeout=10)
 
 def get_info_from_city(city_name):
-    location = geolocator.geocode(city_name, language='en', exactly_one=True)
+    import pycountry
+    
+    location = get_geolocator().geocode(city_name, language='en', exactly_one=True)
     if not location:
         return None
     
@@ -0,0 +1,105 @@
+import os
+
+import httpx
+import streamlit as st
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BACKEND_URL = os.getenv('BACKEND_URL', 'http://127.0.0.1:8000')
+# Путь к unix-сокету uvicorn (--uds), если бэкенд на той же машине
+BACKEND_UDS = os.getenv('BACKEND_UDS')
+
+# Бюджет хода на бэкенде 90 с; читать ждём чуть дольше, чтобы получить ответ деградировавшего графа
+BACKEND_CONNECT_TIMEOUT = float(os.getenv('BACKEND_CONNECT_TIMEOUT', '5'))
+BACKEND_READ_TIMEOUT = float(os.getenv('BACKEND_READ_TIMEOUT', '105'))
+BACKEND_MAX_CONNECTIONS = int(os.getenv('BACKEND_MAX_CONNECTIONS', '32'))
+
+# Адрес бэкенда, видимый из браузера (картинки карт /cards/...); пусто — картинки с GitHub
+ASSETS_PUBLIC_URL = os.getenv('ASSETS_PUBLIC_URL', '').rstrip('/')
+
+
+@st.cache_resource
+def get_backend_client() -> httpx.Client:
+    """Один пул keep-alive соединений к FastAPI на весь процесс Streamlit.
+
+    Клиент потокобезопасен, поэтому его делят все сессии: ход чата не
+    тратит время на новое TCP-соединение.
+    """
+    transport = httpx.HTTPTransport(uds=BACKEND_UDS) if BACKEND_UDS else httpx.HTTPTransport()
+
+    return httpx.Client(
+        base_url=BACKEND_URL,
+        transport=transport,
+        timeout=httpx.Timeout(BACKEND_READ_TIMEOUT, connect=BACKEND_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=BACKEND_MAX_CONNECTIONS, max_keepalive_connections=BACKEND_MAX_CONNECTIONS, keepalive_expiry=60),
+    )
+
+
+def create_web_client() -> httpx.Client:
+    # Внешние ресурсы (аватары Google) — отдельный пул: бэкенд может слушать unix-сокет.
+    # Без кеша Streamlit: клиентом владеет AvatarCache и зовёт его из своих потоков
+    return httpx.Client(
+        timeout=httpx.Timeout(10, connect=BACKEND_CONNECT_TIMEOUT),
+        follow_redirects=True,
+        limits=httpx.Limits(max_connections=16, max_keepalive_connections=8, keepalive_expiry=60),
+    )
+
+
+def warm_session(user_id: str, birth_day=None, time_birth=None, city=None, country=None):
+    # Бэкенд отвечает сразу, а контекст Zep, натальную карту и соединения готовит в фоне
+    try:
+        get_backend_client().post('/warm', json={
+            'user_id': user_id,
+            'birth_day': birth_day,
+            'time_birth': time_birth,
+            'city': city,
+            'country': country,
+        }, timeout=2).raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"Warmup request failed: {e}")
+
+
+def precompute_chart(user_id: str, birth_day=None, time_birth=None, city=None, country=None):
+    # Профиль изменился — бэкенд в фоне считает сводку натальной карты для астро-агента
+    try:
+        get_backend_client().post('/charts', json={
+            'user_id': user_id,
+            'birth_day': birth_day,
+            'time_birth': time_birth,
+            'city': city,
+            'country': country,
+        }, timeout=2).raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"Chart precompute request failed: {e}")
+
+
+@st.cache_resource(ttl=600, show_spinner=False)
+def get_card_manifest() -> dict:
+    # cards: slug → размер → ориентация → формат → имя файла с хешем;
+    # sizes: вариант → ширина в пикселях; version: хеш содержимого — ключ кеша разметки раскладов.
+    # cache_resource: один и тот же объект до истечения ttl, без копии на каждый вызов
+    if not ASSETS_PUBLIC_URL:
+        return {'version': None, 'sizes': {}, 'cards': {}}
+    try:
+        return get_backend_client().get('/cards/manifest', timeout=5).raise_for_status().json()
+    except httpx.HTTPError as e:
+        print(f"Card manifest unavailable: {e}")
+        return {'version': None, 'sizes': {}, 'cards': {}}
+
+
+@st.cache_data(ttl=3600, max_entries=1024, show_spinner=False)
+def get_spread_image(spread: str, cards: tuple[tuple[str, bool], ...], layout: dict) -> str | None:
+    # URL готовой картинки расклада или None, если бэкенд не смог её собрать
+    if not ASSETS_PUBLIC_URL:
+        return None
+    try:
+        response = get_backend_client().post('/spreads', json={
+            'spread': spread,
+            'cards': [{'name': name, 'reversed': reversed} for name, reversed in cards],
+            **layout,
+        }, timeout=15)
+        return ASSETS_PUBLIC_URL + response.raise_for_status().json()['url']
+    except httpx.HTTPError as e:
+        print(f"Spread image unavailable for {spread}: {e}")
+        return None
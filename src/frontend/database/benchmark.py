@@ -0,0 +1,121 @@
+"""Замер загрузки страниц истории на большой таблице messages.
+
+    python -m database.benchmark --messages 2000000 --users 1000
+
+Заполняет настроенную БД синтетическими пользователями `bench-*`, меряет
+первую страницу и страницы в глубине истории и печатает планы запроса для
+первой страницы и для страницы по keyset-курсору.
+При keyset-пагинации обе величины не зависят от числа сообщений.
+Флаг --cleanup удаляет синтетические данные.
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import delete, text
+
+from .migrations import migrate
+from .model import get_engine, create_tables, UserBirthInfo, Message, new_session
+from .queries import get_history
+from .runner import runner
+
+PREFIX = 'bench-'
+
+
+async def seed(messages: int, users: int):
+    async with get_engine().begin() as conn:
+        await conn.execute(text(
+            "INSERT INTO user_birth_info (user_id, birth_date, language) "
+            "SELECT :prefix || n, '01.01.2000', 'en' FROM generate_series(1, :users) AS n "
+            "ON CONFLICT (user_id) DO NOTHING"
+        ), {'prefix': PREFIX, 'users': users})
+        await conn.execute(text(
+            "INSERT INTO messages (user_id, sender, text, created_at) "
+            "SELECT :prefix || (n % :users + 1), CASE WHEN n % 2 = 0 THEN 'user' ELSE 'bot' END, "
+            "'message ' || n, now() - make_interval(secs => :messages - n) "
+            "FROM generate_series(1, :messages) AS n"
+        ), {'prefix': PREFIX, 'users': users, 'messages': messages})
+        await conn.execute(text('ANALYZE messages'))
+
+
+async def measure(user_id: str, limit: int, pages: int) -> tuple[list[float], list[float]]:
+    first, deep = [], []
+    cursor = None
+
+    for page in range(pages):
+        started = time.perf_counter()
+        result = await get_history(user_id, limit, cursor)
+        (first if page == 0 else deep).append((time.perf_counter() - started) * 1000)
+
+        cursor = result.older
+        if cursor is None:
+            break
+
+    return first, deep
+
+
+async def explain(user_id: str, limit: int):
+    # Курсор на вторую страницу — тот же, что отдаёт get_history
+    older = (await get_history(user_id, limit)).older
+
+    async with get_engine().connect() as conn:
+        print('First page:')
+        plan = await conn.execute(text(
+            "EXPLAIN (ANALYZE, BUFFERS) SELECT id, sender, text, html, created_at FROM messages "
+            "WHERE user_id = :user_id ORDER BY created_at DESC, id DESC LIMIT :limit"
+        ), {'user_id': user_id, 'limit': limit + 1})
+        print('\n'.join(row[0] for row in plan))
+
+        if older is None:
+            return
+
+        print('Keyset page:')
+        plan = await conn.execute(text(
+            "EXPLAIN (ANALYZE, BUFFERS) SELECT id, sender, text, html, created_at FROM messages "
+            "WHERE user_id = :user_id AND (created_at, id) < (:created_at, :id) "
+            "ORDER BY created_at DESC, id DESC LIMIT :limit"
+        ), {'user_id': user_id, 'created_at': older.created_at, 'id': older.id, 'limit': limit + 1})
+        print('\n'.join(row[0] for row in plan))
+
+
+async def cleanup():
+    async with new_session() as session:
+        await session.execute(delete(Message).where(Message.user_id.startswith(PREFIX)))
+        await session.execute(delete(UserBirthInfo).where(UserBirthInfo.user_id.startswith(PREFIX)))
+        await session.commit()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=2_000_000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--cleanup', action='store_true')
+    args = parser.parse_args()
+
+    await create_tables()
+    await migrate()
+
+    if args.cleanup:
+        await cleanup()
+        return
+
+    if not args.skip_seed:
+        started = time.perf_counter()
+        await seed(args.messages, args.users)
+        print(f"Seeded {args.messages} messages in {time.perf_counter() - started:.1f}s")
+
+    user_id = f'{PREFIX}1'
+    first, deep = await measure(user_id, args.limit, args.pages)
+
+    print(f"First page: median {statistics.median(first):.2f} ms")
+    if deep:
+        print(f"Older pages ({len(deep)}): median {statistics.median(deep):.2f} ms, max {max(deep):.2f} ms")
+    await explain(user_id, args.limit)
+
+
+if __name__ == '__main__':
+    # Тот же цикл, что у пула при импорте пакета database
+    runner.run(main())
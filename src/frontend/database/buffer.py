@@ -0,0 +1,136 @@
+import atexit
+import os
+import threading
+import time
+
+from collections import deque
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from . import queries
+from .migrations import ensure_schema
+from .runner import runner
+
+
+# Сколько сообщений копится до внеочередной записи
+MESSAGE_FLUSH_SIZE = int(os.getenv('MESSAGE_FLUSH_SIZE', '50'))
+# Максимальная задержка записи, секунды
+MESSAGE_FLUSH_INTERVAL = float(os.getenv('MESSAGE_FLUSH_INTERVAL', '1.0'))
+
+
+class MessageBuffer:
+    """Отложенная запись сообщений чата (write-behind).
+
+    Сессии Streamlit только кладут сообщение в общую очередь процесса, а
+    фоновый поток пишет накопленное одной многострочной вставкой — когда
+    набралось `flush_size` сообщений или прошло `interval` секунд.
+
+    Доставка «хотя бы раз»: пачка уходит из очереди только после commit,
+    при ошибке она остаётся в голове очереди и повторяется с задержкой.
+    При остановке процесса остаток дописывается. Время сообщения
+    фиксируется при постановке в очередь, поэтому задержка записи не
+    меняет порядок истории.
+    """
+
+    def __init__(self, flush_size: int, interval: float, max_backoff: float = 30):
+        self.flush_size = flush_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+
+        self._pending = deque()
+        self._ready = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._failures = 0
+
+        self._thread = threading.Thread(target=self._run, name='message-buffer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, user_id, sender, text=None, html=None, cards=None, spread=None):
+        row = {'user_id': user_id, 'sender': sender, 'text': text, 'html': html, 'cards': cards, 'spread': spread}
+        # Часы процесса и БД разные: запоминаем момент, а в запрос уйдёт возраст сообщения
+        enqueued = time.monotonic()
+        with self._ready:
+            self._pending.append((enqueued, row))
+            # Во время сбоя БД поток ждёт своей задержки, не будим его
+            if len(self._pending) >= self.flush_size and not self._failures:
+                self._ready.notify()
+
+    def flush(self) -> int:
+        """Пишет всё накопленное пачками; возвращает число записанных сообщений."""
+        written = 0
+
+        # Один писатель за раз, иначе пачки могут лечь в БД не по порядку
+        with self._flush_lock:
+            while True:
+                with self._ready:
+                    batch = [self._pending[i] for i in range(min(self.flush_size, len(self._pending)))]
+                if not batch:
+                    return written
+
+                ensure_schema()
+                try:
+                    runner.run(queries.add_messages(self._rows(batch)), timeout=30)
+                except (IntegrityError, DataError):
+                    # Повтор не поможет; пишем по одному, чтобы одна битая строка не держала очередь
+                    written += self._write_each(batch)
+                    continue
+
+                self._drop(len(batch))
+                written += len(batch)
+
+    def _rows(self, batch: list[tuple]) -> list[dict]:
+        now = time.monotonic()
+        return [{**row, 'age': now - enqueued} for enqueued, row in batch]
+
+    def _drop(self, count: int):
+        with self._ready:
+            for _ in range(count):
+                self._pending.popleft()
+
+    def _write_each(self, batch: list[tuple]) -> int:
+        # Каждая строка уходит из очереди сразу после записи: если дальше случится
+        # таймаут, повтор пачки не вставит уже записанные строки второй раз
+        written = 0
+        for entry in batch:
+            try:
+                runner.run(queries.add_messages(self._rows([entry])), timeout=30)
+                written += 1
+            except (IntegrityError, DataError) as e:
+                print(f"Dropped message for {entry[1]['user_id']}: {e}")
+            self._drop(1)
+        return written
+
+    def _run(self):
+        while True:
+            with self._ready:
+                if not self._stopped and (self._failures or len(self._pending) < self.flush_size):
+                    self._ready.wait(self._delay())
+                if self._stopped:
+                    return
+
+            try:
+                self.flush()
+                self._failures = 0
+            except Exception as e:
+                self._failures += 1
+                print(f"Message flush failed ({len(self._pending)} pending): {e}")
+
+    def _delay(self) -> float:
+        # После ошибок БД не долбим её каждую секунду
+        return min(self.max_backoff, self.interval * 2 ** self._failures)
+
+    def close(self):
+        with self._ready:
+            self._stopped = True
+            self._ready.notify()
+        self._thread.join()
+
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Lost {len(self._pending)} unsaved messages on shutdown: {e}")
+
+
+buffer = MessageBuffer(MESSAGE_FLUSH_SIZE, MESSAGE_FLUSH_INTERVAL)
@@ -0,0 +1,117 @@
+import threading
+
+from sqlalchemy import text
+
+from .model import get_engine, create_tables
+from .runner import runner
+
+
+# Упорядоченный список миграций: (версия, описание, SQL, индекс, создаваемый CONCURRENTLY).
+# CREATE INDEX CONCURRENTLY не блокирует запись в таблицу, но не может
+# выполняться внутри транзакции — такие миграции идут с autocommit. Упавшая
+# сборка оставляет индекс INVALID, и IF NOT EXISTS его бы пропустил, поэтому
+# такой индекс пересобирается, а версия записывается только за валидным.
+MIGRATIONS = [
+    (
+        1,
+        'messages (user_id, created_at, id) for history pages',
+        'CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_messages_user_id_created_at '
+        'ON messages (user_id, created_at DESC, id DESC)',
+        'ix_messages_user_id_created_at',
+    ),
+    (
+        2,
+        'messages.cards and messages.spread for stored spreads',
+        'ALTER TABLE messages ADD COLUMN IF NOT EXISTS cards JSONB, '
+        'ADD COLUMN IF NOT EXISTS spread VARCHAR(50)',
+        None,
+    ),
+    (
+        3,
+        'user_birth_info.zep_provisioned_at for background Zep provisioning',
+        'ALTER TABLE user_birth_info ADD COLUMN IF NOT EXISTS zep_provisioned_at TIMESTAMP',
+        None,
+    ),
+]
+
+# Ключ pg_advisory_lock: миграции одновременно стартующих процессов идут по очереди
+MIGRATIONS_LOCK = 7_245_001
+
+
+async def _applied(conn) -> set[int]:
+    await conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_migrations ('
+        'version INTEGER PRIMARY KEY, '
+        'description TEXT NOT NULL, '
+        'applied_at TIMESTAMP NOT NULL DEFAULT now())'
+    ))
+    rows = await conn.execute(text('SELECT version FROM schema_migrations'))
+    return {version for (version,) in rows}
+
+
+async def _index_valid(conn, name: str) -> bool | None:
+    # None — индекса нет, False — сборка CONCURRENTLY упала и оставила INVALID
+    return await conn.scalar(text(
+        'SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name'
+    ), {'name': name})
+
+
+async def migrate():
+    """Применяет миграции, которых ещё нет в schema_migrations."""
+    async with get_engine().connect() as lock:
+        # Без открытой транзакции: её не ждал бы CREATE INDEX CONCURRENTLY.
+        # Иначе один процесс удалил бы как INVALID индекс, который другой ещё строит
+        lock = await lock.execution_options(isolation_level='AUTOCOMMIT')
+        await lock.execute(text('SELECT pg_advisory_lock(:key)'), {'key': MIGRATIONS_LOCK})
+        try:
+            async with get_engine().begin() as conn:
+                applied = await _applied(conn)
+
+            for version, description, sql, index in MIGRATIONS:
+                if version not in applied:
+                    await _apply(version, description, sql, index)
+        finally:
+            await lock.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': MIGRATIONS_LOCK})
+
+
+async def _apply(version: int, description: str, sql: str, index: str | None):
+    options = {'isolation_level': 'AUTOCOMMIT'} if index else {}
+    async with get_engine().connect() as conn:
+        conn = await conn.execution_options(**options)
+
+        if index and await _index_valid(conn, index) is False:
+            print(f"Rebuilding invalid index {index}")
+            await conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS {index}'))
+
+        await conn.execute(text(sql))
+
+        if index and not await _index_valid(conn, index):
+            raise RuntimeError(f'Index {index} is invalid after migration {version}')
+
+        await conn.execute(text(
+            'INSERT INTO schema_migrations (version, description) VALUES (:version, :description) '
+            'ON CONFLICT (version) DO NOTHING'
+        ), {'version': version, 'description': description})
+        await conn.commit()
+
+    print(f"Applied migration {version}: {description}")
+
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+
+def ensure_schema():
+    """Таблицы и миграции — один раз на процесс, при первом обращении к БД, а не при импорте.
+
+    Вызывается и из потоков без ScriptRunContext (запись сообщений, CLI),
+    поэтому это обычный флаг процесса, а не кеш Streamlit. Если миграция
+    упала, следующий вызов попробует снова.
+    """
+    global _schema_ready
+    with _schema_lock:
+        if not _schema_ready:
+            runner.run(create_tables())
+            runner.run(migrate())
+            _schema_ready = True
+    return True
@@ -1,9 +1,13 @@
-from sqlalchemy import create_engine, Column, Integer, String, Date, Time, Text, DateTime, ForeignKey, func
-from sqlalchemy.orm import declarative_base, sessionmaker, relationship, Mapped, mapped_column
+from sqlalchemy import String, Text, DateTime, ForeignKey, func
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base, relationship, Mapped, mapped_column
 from datetime import datetime
 from dotenv import load_dotenv
 import os
 
+from .runner import runner
+
 load_dotenv()
 
 POSTGRESQL_USER = os.getenv('POSTGRESQL_USER')
@@ -21,16 +25,41 @@ if not all([POSTGRESQL_USER, POSTGRESQL_PASSWORD, POSTGRESQL_HOST, POSTGRESQL_PO
     print(f"POSTGRESQL_PORT: {POSTGRESQL_PORT}")
     print(f"POSTGRESQL_DBNAME: {POSTGRESQL_DBNAME}")
 
+# Пул соединений на процесс Streamlit
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '5'))
+# Сколько подготовленных запросов держит каждое соединение
+DB_STATEMENT_CACHE = int(os.getenv('DB_STATEMENT_CACHE', '256'))
+# SQL в лог — только для отладки
+DB_ECHO = os.getenv('DB_ECHO', '').lower() in ('1', 'true', 'yes')
+
 DATABASE_URL = (
-    f"postgresql+psycopg2://{POSTGRESQL_USER}:{POSTGRESQL_PASSWORD}"
-    f"@{POSTGRESQL_HOST}:{POSTGRESQL_PORT}/{POSTGRESQL_DBNAME}?sslmode=require"
+    f"postgresql+asyncpg://{POSTGRESQL_USER}:{POSTGRESQL_PASSWORD}"
+    f"@{POSTGRESQL_HOST}:{POSTGRESQL_PORT}/{POSTGRESQL_DBNAME}"
+    f"?prepared_statement_cache_size={DB_STATEMENT_CACHE}"
 )
 
-# Синхронный движок
-engine = create_engine(DATABASE_URL, echo=True)
+# Асинхронный движок: один на процесс, соединения проверяются перед выдачей из пула
+def get_engine():
+    return runner.resource('engine', _create_engine)
+
+def _create_engine():
+    return create_async_engine(
+        DATABASE_URL,
+        echo=DB_ECHO,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        connect_args={'ssl': 'require', 'statement_cache_size': DB_STATEMENT_CACHE},
+    )
 
-# Сессия
-SessionLocal = sessionmaker(bind=engine)
+# Фабрика сессий; объекты остаются читаемыми после commit без лишнего SELECT
+def get_session_factory():
+    return runner.resource('sessions', lambda: async_sessionmaker(get_engine(), expire_on_commit=False))
+
+def new_session():
+    return get_session_factory()()
 
 Base = declarative_base()
 
@@ -44,6 +73,8 @@ class UserBirthInfo(Base):
     city: Mapped[str] = mapped_column(String(50), nullable=True)
     country: Mapped[str] = mapped_column(String(50), nullable=True)
     language: Mapped[str] = mapped_column(String(5), nullable=False)
+    # Когда пользователь и его тред заведены в Zep; NULL — ещё нет
+    zep_provisioned_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
 
     messages = relationship("Message", back_populates="user", cascade="all, delete-orphan")
 
@@ -55,9 +86,14 @@ class Message(Base):
     sender: Mapped[str] = mapped_column(String(20), nullable=False)  # "user" или "bot"
     text: Mapped[str] = mapped_column(Text, nullable=True)
     html: Mapped[str] = mapped_column(Text, nullable=True)
+    # Расклад бота: [{"name": str, "reversed": bool}, ...] и его название
+    cards: Mapped[list] = mapped_column(JSONB, nullable=True)
+    spread: Mapped[str] = mapped_column(String(50), nullable=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime, default=func.now())
 
     user = relationship("UserBirthInfo", back_populates="messages")
 
-# Создаём таблицы
-Base.metadata.create_all(engine)
\ No newline at end of file
+
+async def create_tables():
+    async with get_engine().begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
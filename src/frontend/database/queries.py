@@ -0,0 +1,148 @@
+from datetime import timedelta
+
+from sqlalchemy import func, insert, select, tuple_, update
+
+from .model import new_session, UserBirthInfo, Message
+from .schema import UserInfo, StoredMessage, HistoryCursor, HistoryPage
+
+
+def _user_info(user: UserBirthInfo) -> UserInfo:
+    return UserInfo(
+        user_id=user.user_id,
+        birth_date=user.birth_date,
+        birth_time=user.birth_time,
+        city=user.city,
+        country=user.country,
+        language=user.language,
+    )
+
+
+async def add_user(user_id, birth_date, birth_time=None, city=None, country=None, language=None) -> UserInfo:
+    async with new_session() as session:
+        user = UserBirthInfo(
+            user_id=user_id,
+            birth_date=birth_date,
+            birth_time=birth_time,
+            city=city,
+            country=country,
+            language=language
+        )
+        session.add(user)
+        await session.commit()
+        return _user_info(user)
+
+
+async def get_user(user_id) -> UserInfo | None:
+    async with new_session() as session:
+        user = await session.scalar(select(UserBirthInfo).where(UserBirthInfo.user_id == user_id))
+        return _user_info(user) if user else None
+
+
+async def add_message(user_id, sender, text=None, html=None, cards=None, spread=None) -> int:
+    async with new_session() as session:
+        # RETURNING вместо refresh — один запрос вместо двух
+        message_id = await session.scalar(
+            insert(Message).values(user_id=user_id, sender=sender, text=text, html=html, cards=cards, spread=spread)
+            .returning(Message.id)
+        )
+        await session.commit()
+        return message_id
+
+
+async def add_messages(rows: list[dict]):
+    # Одна многострочная вставка на всю пачку. `age` — сколько секунд сообщение
+    # ждало записи: created_at отсчитывается от часов БД, но на момент сохранения
+    rows = [
+        {**row, 'created_at': func.now() - timedelta(seconds=age)} if (age := row.pop('age', None)) is not None else row
+        for row in map(dict, rows)
+    ]
+    async with new_session() as session:
+        await session.execute(insert(Message).values(rows))
+        await session.commit()
+
+
+async def get_history(user_id, limit=10, before: HistoryCursor | None = None) -> HistoryPage:
+    """Страница истории, от старых к новым, плюс курсор на страницу старше.
+
+    Keyset-пагинация по индексу (user_id, created_at, id): каждая страница —
+    один проход по индексу от курсора, без OFFSET, поэтому время не растёт
+    с глубиной и размером таблицы.
+    """
+    query = (
+        select(Message.id, Message.sender, Message.text, Message.html, Message.cards, Message.spread, Message.created_at)
+        .where(Message.user_id == user_id)
+        .order_by(Message.created_at.desc(), Message.id.desc())
+        # Лишняя строка показывает, есть ли что-то старше
+        .limit(limit + 1)
+    )
+    if before is not None:
+        query = query.where(tuple_(Message.created_at, Message.id) < tuple_(before.created_at, before.id))
+
+    async with new_session() as session:
+        rows = (await session.execute(query)).all()
+
+    messages = [StoredMessage(*row) for row in rows[:limit]]
+    older = HistoryCursor(messages[-1].created_at, messages[-1].id) if len(rows) > limit else None
+    return HistoryPage(messages=messages[::-1], older=older)
+
+
+async def get_last_messages(user_id, limit=10) -> list[StoredMessage]:
+    return (await get_history(user_id, limit)).messages
+
+
+async def update_user(user_id: str, birth_date=None, birth_time=None, city: str = None, country: str = None, language=None) -> UserInfo:
+    async with new_session() as session:
+        user = await session.scalar(select(UserBirthInfo).where(UserBirthInfo.user_id == user_id))
+        if not user:
+            # Если пользователя нет, создаем нового
+            user = UserBirthInfo(
+                user_id=user_id,
+                birth_date=birth_date or "",
+                birth_time=birth_time,
+                city=city,
+                country=country,
+                language=language
+            )
+            session.add(user)
+        else:
+            # Обновляем существующего пользователя
+            if birth_date:
+                user.birth_date = birth_date
+            if birth_time:
+                user.birth_time = birth_time
+            if city:
+                user.city = city
+            if country:
+                user.country = country
+            if language:
+                user.language = language
+        await session.commit()
+        return _user_info(user)
+
+
+async def is_zep_provisioned(user_id) -> bool:
+    async with new_session() as session:
+        provisioned_at = await session.scalar(select(UserBirthInfo.zep_provisioned_at).where(UserBirthInfo.user_id == user_id))
+        return provisioned_at is not None
+
+
+async def mark_zep_provisioned(user_id):
+    async with new_session() as session:
+        await session.execute(update(UserBirthInfo).where(UserBirthInfo.user_id == user_id).values(zep_provisioned_at=func.now()))
+        await session.commit()
+
+
+async def get_unprovisioned_users(limit=None) -> list[str]:
+    # user_id тех, кого ещё нет в Zep, — для догоняющей загрузки
+    query = select(UserBirthInfo.user_id).where(UserBirthInfo.zep_provisioned_at.is_(None)).order_by(UserBirthInfo.id)
+    if limit:
+        query = query.limit(limit)
+
+    async with new_session() as session:
+        return list(await session.scalars(query))
+
+
+async def get_all_users() -> list[UserInfo]:
+    async with new_session() as session:
+        users = await session.scalars(select(UserBirthInfo))
+        return [_user_info(user) for user in users]
@@ -1,146 +1,109 @@
-from .model import SessionLocal, UserBirthInfo, Message
+from . import queries
+from .migrations import ensure_schema
+from .runner import runner
+from .buffer import buffer
+from .schema import UserInfo, HistoryCursor, HistoryPage
 
-def add_user(user_id, birth_date, birth_time=None, city=None, country=None, language=None):
+# Синхронные обёртки над queries для страниц Streamlit
+
+def run(coro):
+    try:
+        ensure_schema()
+    except Exception:
+        coro.close()
+        raise
+    return runner.run(coro)
+
+
+def add_user(user_id, birth_date, birth_time=None, city=None, country=None, language=None) -> UserInfo:
     try:
-        session = SessionLocal()
-        user = UserBirthInfo(
-            user_id=user_id,
-            birth_date=birth_date,
-            birth_time=birth_time,
-            city=city,
-            country=country,
-            language=language
-        )
-        session.add(user)
-        session.commit()
-        session.refresh(user)  # Обновляем объект после коммита
-        return user
+        user = run(queries.add_user(user_id, birth_date, birth_time, city, country, language))
     except Exception as e:
-        session.rollback()
         print(f"Error adding user: {e}")
         raise
-    finally:
-        session.close()
+    return user
 
 # Получение пользователя по user_id
-def get_user(user_id):
+def get_user(user_id) -> UserInfo | None:
     try:
-        session = SessionLocal()
-        user = session.query(UserBirthInfo).filter(UserBirthInfo.user_id == user_id).first()
-        if user:
-            # Создаем копию данных, чтобы избежать проблем с сессией
-            user_data = {
-                'user_id': user.user_id,
-                'birth_date': user.birth_date,
-                'birth_time': user.birth_time,
-                'city': user.city,
-                'country': user.country,
-                'language': user.language
-            }
-            return type('UserInfo', (), user_data)()  # Создаем объект с атрибутами
-        return None
+        return run(queries.get_user(user_id))
     except Exception as e:
         print(f"Error getting user: {e}")
         return None
-    finally:
-        session.close()
 
 # Добавление сообщения
-def add_message(user_id, sender, text=None, html=None):
+def add_message(user_id, sender, text=None, html=None, cards=None, spread=None) -> int:
     try:
-        session = SessionLocal()
-        msg = Message(
-            user_id=user_id,
-            sender=sender,
-            text=text,
-            html=html
-        )
-        session.add(msg)
-        session.commit()
-        session.refresh(msg)  # Обновляем объект после коммита
-        return msg
+        return run(queries.add_message(user_id, sender, text, html, cards, spread))
     except Exception as e:
-        session.rollback()
         print(f"Error adding message: {e}")
         raise
-    finally:
-        session.close()
 
-# Получение последних N сообщений
+# Отложенная запись: не ждёт БД, сообщение уйдёт со следующей пачкой
+def save_message(user_id, sender, text=None, html=None, cards=None, spread=None):
+    buffer.add(user_id, sender, text, html, cards, spread)
+
+# Дописать отложенные сообщения перед чтением истории
+def flush_messages():
+    try:
+        buffer.flush()
+    except Exception as e:
+        print(f"Error flushing messages: {e}")
+
+# Сообщение из БД в формате st.session_state.messages
+def to_chat_message(msg):
+    return {'key': f'db-{msg.id}', 'role': msg.sender, 'content': msg.text, 'cards': msg.cards, 'unlock_name': msg.spread, 'html': msg.html}
+
+# Получение последних N сообщений в формате st.session_state.messages
 def get_last_messages(user_id, limit=10):
     try:
-        session = SessionLocal()
-        msgs = (
-            session.query(Message)
-            .filter(Message.user_id == user_id)
-            .order_by(Message.created_at.desc())
-            .limit(limit)
-            .all()
-        )
-        # Создаем копии данных, чтобы избежать проблем с сессией
-        messages_data = []
-        for msg in msgs:
-            msg_data = {
-                'role': msg.sender,
-                'content': msg.text,
-            }
-            messages_data.append(msg_data)  # Создаем объект с атрибутами
-        return list(reversed(messages_data))
+        messages = run(queries.get_last_messages(user_id, limit))
+        return [to_chat_message(msg) for msg in messages]
     except Exception as e:
         print(f"Error getting messages: {e}")
         return []
-    finally:
-        session.close()
 
-def update_user(user_id: str, birth_date = None, birth_time = None, city: str = None, country: str = None, language=None):
+# Страница истории старше курсора; в сообщениях есть html расклада
+def get_history(user_id, limit=10, before: HistoryCursor | None = None) -> HistoryPage:
+    try:
+        return run(queries.get_history(user_id, limit, before))
+    except Exception as e:
+        print(f"Error getting history: {e}")
+        return HistoryPage(messages=[], older=None)
+
+def update_user(user_id: str, birth_date = None, birth_time = None, city: str = None, country: str = None, language=None) -> UserInfo:
     try:
-        with SessionLocal() as session:
-            user = session.query(UserBirthInfo).filter_by(user_id=user_id).first()
-            if not user:
-                # Если пользователя нет, создаем нового
-                user = UserBirthInfo(
-                    user_id=user_id,
-                    birth_date=birth_date or "",
-                    birth_time=birth_time,
-                    city=city,
-                    country=country,
-                    language=language
-                )
-                session.add(user)
-            else:
-                # Обновляем существующего пользователя
-                if birth_date:
-                    user.birth_date = birth_date
-                if birth_time:
-                    user.birth_time = birth_time
-                if city:
-                    user.city = city
-                if country:
-                    user.country = country
-                if language:
-                    user.language = language
-            session.commit()
-            session.refresh(user)  # Обновляем объект после коммита
-            return user
+        user = run(queries.update_user(user_id, birth_date, birth_time, city, country, language))
     except Exception as e:
         print(f"Error updating user: {e}")
         raise
+    return user
 
-def get_all_users():
-    session = SessionLocal()
+# Заведён ли пользователь в Zep; при ошибке БД считаем, что нет — повторный вызов безвреден
+def is_zep_provisioned(user_id) -> bool:
     try:
-        users = session.query(UserBirthInfo).all()
-        print("📋 All users in DB:")
-        for u in users:
-            print(f"""
+        return run(queries.is_zep_provisioned(user_id))
+    except Exception as e:
+        print(f"Error checking Zep provisioning: {e}")
+        return False
+
+def mark_zep_provisioned(user_id):
+    run(queries.mark_zep_provisioned(user_id))
+
+def get_unprovisioned_users(limit=None) -> list[str]:
+    return run(queries.get_unprovisioned_users(limit))
+
+def get_all_users() -> list[UserInfo]:
+    users = run(queries.get_all_users())
+    print("📋 All users in DB:")
+    for u in users:
+        print(f"""
 👤 UserID: {u.user_id}
    🌍 Birth place: {u.city}, {u.country}
    🎂 Date: {u.birth_date}
    ⏰ Time: {u.birth_time}
 """)
-        return users
-    finally:
-        session.close()
+    return users
 
 
 # --- Тест ---
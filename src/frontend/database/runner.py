@@ -0,0 +1,47 @@
+import asyncio
+import threading
+
+
+class LoopRunner:
+    """Фоновый event loop для вызова асинхронного слоя БД из Streamlit.
+
+    Streamlit выполняет скрипт в своих потоках без event loop, а соединения
+    asyncpg привязаны к циклу, в котором созданы. Поэтому весь пул живёт в
+    одном цикле, а синхронные обёртки отправляют в него корутины.
+
+    Движок и фабрика сессий — объекты процесса рядом с циклом (`resource`),
+    а не кеш Streamlit: к ним обращаются фоновые потоки и CLI, где нет
+    ScriptRunContext.
+    """
+
+    def __init__(self):
+        self._loop = None
+        # Реентерабельный: фабрика ресурса может запросить другой ресурс
+        self._lock = threading.RLock()
+        self._resources = {}
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name='db-loop', daemon=True)
+        thread.start()
+        return loop
+
+    @property
+    def loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = self._start()
+            return self._loop
+
+    def resource(self, name: str, factory):
+        # Фабрика не должна ждать цикл: его корутины сами берут ресурсы под этим же замком
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = factory()
+            return self._resources[name]
+
+    def run(self, coro, timeout: float | None = None):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+
+runner = LoopRunner()
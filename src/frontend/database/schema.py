@@ -0,0 +1,38 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+
+@dataclass(frozen=True, slots=True)
+class UserInfo:
+    user_id: str
+    birth_date: str
+    birth_time: Optional[str]
+    city: Optional[str]
+    country: Optional[str]
+    language: Optional[str]
+
+
+@dataclass(frozen=True, slots=True)
+class StoredMessage:
+    id: int
+    sender: str
+    text: Optional[str]
+    html: Optional[str]
+    cards: Optional[list[dict]]
+    spread: Optional[str]
+    created_at: datetime
+
+
+@dataclass(frozen=True, slots=True)
+class HistoryCursor:
+    # Ключ самого старого сообщения на уже загруженной странице
+    created_at: datetime
+    id: int
+
+
+@dataclass(frozen=True, slots=True)
+class HistoryPage:
+    messages: list[StoredMessage]
+    # None — старше сообщений нет
+    older: Optional[HistoryCursor]
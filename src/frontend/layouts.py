@@ -0,0 +1,109 @@
+import math
+
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, slots=True)
+class Slot:
+    # Положение карты в процентах от ширины и высоты контейнера
+    top: float
+    left: float
+    # Ширина в процентах от ширины контейнера, высота — из aspect (ширина / высота)
+    width: float
+    aspect: float = 2 / 3
+    # Поворот места в раскладе (пересекающая карта Кельтского креста), к нему добавляется перевёрнутость
+    rotate: int = 0
+    z: int = 0
+
+
+@dataclass(frozen=True, slots=True)
+class Layout:
+    slots: tuple[Slot, ...]
+    # Контейнер: максимальная ширина в px и соотношение ширины к высоте
+    max_width: int
+    aspect: float
+    # Высота iframe Streamlit
+    height: int
+    rounded: bool = True
+    shadow: bool = True
+    fit: str = 'contain'
+
+    def as_dict(self) -> dict:
+        return {
+            'max_width': self.max_width,
+            'aspect': self.aspect,
+            'slots': [{'top': s.top, 'left': s.left, 'width': s.width, 'aspect': s.aspect, 'rotate': s.rotate, 'z': s.z}
+                      for s in self.slots],
+        }
+
+
+def _row(top: float, lefts, width: float, aspect: float = 2 / 3) -> tuple[Slot, ...]:
+    return tuple(Slot(top, left, width, aspect) for left in lefts)
+
+
+def _horseshoe() -> tuple[Slot, ...]:
+    # Полукруг радиусом 200px с центром (250, 250) в контейнере 500×300, карта 120×180
+    slots = []
+    for i in range(7):
+        angle = math.pi + (i / 6) * (0 - math.pi)
+        left = 250 + 200 * math.cos(angle) - 60
+        top = 250 + 200 * math.sin(angle) - 90
+        slots.append(Slot(top / 300 * 100, left / 500 * 100, 24))
+    return tuple(slots)
+
+
+# Координаты из прежних render_* в templates.py
+SPREAD_LAYOUTS = {
+    "Single Card": Layout(
+        slots=(Slot(50 / 3, 80 / 3, 140 / 3, 140 / 220),),
+        max_width=300, aspect=1, height=300,
+    ),
+    "Three Card": Layout(
+        slots=_row(50, (15, 50, 85), 18),
+        max_width=600, aspect=3 / 2, height=400,
+    ),
+    "Celtic Cross": Layout(
+        slots=(
+            Slot(50, 50, 15), Slot(50, 50, 15, rotate=90), Slot(50, 70, 15), Slot(50, 10, 15),
+            Slot(30, 50, 15), Slot(70, 50, 15), Slot(90, 10, 15), Slot(90, 20, 15),
+            Slot(90, 30, 15), Slot(90, 40, 15),
+        ),
+        max_width=800, aspect=4 / 3, height=600,
+    ),
+    "Horseshoe": Layout(
+        slots=_horseshoe(),
+        max_width=500, aspect=5 / 3, height=300,
+    ),
+    "Relationship Cross": Layout(
+        slots=(
+            Slot(10, 20, 20), Slot(10, 70, 20), Slot(35, 45, 20), Slot(55, 45, 20),
+            Slot(75, 20, 20), Slot(75, 70, 20), Slot(65, 45, 20),
+        ),
+        max_width=400, aspect=4 / 5, height=450, rounded=False, shadow=False,
+    ),
+    "Career Path": Layout(
+        slots=tuple(Slot(top, left, 18) for left in (15, 75) for top in (10, 40, 70)),
+        max_width=520, aspect=1, height=550, fit='cover',
+    ),
+    "Decision Making": Layout(
+        slots=(Slot(10, 20, 20), Slot(10, 60, 20), Slot(40, 20, 20), Slot(40, 60, 20), Slot(65, 40, 20)),
+        max_width=600, aspect=4 / 5, height=400, rounded=False, shadow=False,
+    ),
+    "Year Ahead": Layout(
+        # 12 месяцев в ряд и карта года по центру сверху
+        slots=_row(40, [2 + i * 7 for i in range(12)], 6, 5 / 8) + (Slot(5, 42, 12, z=10),),
+        max_width=1000, aspect=4, height=250, rounded=False, shadow=False,
+    ),
+    "Spiritual Guidance": Layout(
+        slots=_row(15, (10, 45, 80), 18) + _row(55, (10, 45, 80), 18),
+        max_width=700, aspect=2, height=350,
+    ),
+    "Chakra Alignment": Layout(
+        slots=tuple(Slot(top, 15, 18) for top in (0, 14, 28, 42, 56, 70, 84)),
+        max_width=180, aspect=1 / 5, height=900,
+    ),
+    "Shadow Work": Layout(
+        slots=_row(5, (5, 25, 45, 65, 85), 18),
+        max_width=700, aspect=7 / 2, height=200,
+    ),
+}
@@ -49,6 +49,9 @@ translations = {
         "status_astro_node": "Looking at the stars...",
         "status_img_node": "Laying the cards on the table...",
         "status_end": "You are ready to know your destiny",
+        "load_older": "Load older messages",
+        "stream_error": "The stars are silent right now 🌙 Please ask me again in a moment.",
+        "show_spread": "🃏 Show spread: {}",
         "error_saving_user_message": "Error saving message: {}",
         "error_saving_bot_message": "Error saving bot message: {}",
         #footer
@@ -107,6 +110,9 @@ translations = {
         "status_astro_node": "Смотрю на звезды...",
         "status_img_node": "Выкладываю карты на стол...",
         "status_end": "Ты готов(a) узнать свою судьбу",
+        "load_older": "Показать более ранние сообщения",
+        "stream_error": "Звёзды сейчас молчат 🌙 Спроси меня ещё раз чуть позже.",
+        "show_spread": "🃏 Показать расклад: {}",
         "error_saving_user_message": "Ошибка при сохранении сообщения: {}",
         "error_saving_bot_message": "Ошибка при сохранении сообщения: {}",
         #footer
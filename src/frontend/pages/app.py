@@ -1,20 +1,60 @@
 import streamlit as st
 import httpx
-import json
+import uuid
 
 from schema import *
-from templates import create_html_taro
+from stream import NDJSONDecoder, RunFailed, check_frame
+from clients import get_backend_client
+from avatars import user_avatar
+from templates import create_html_taro, show_html_taro
 
-from utils import stream_text, set_data, create_form_with_info
-from database.request import add_message
+from utils import set_data, create_form_with_info, load_older_history, trim_history, SPREAD_TURNS
+from database.request import save_message
 
 from locales import t
+from timing import start_rerun, mark, finish_rerun
 
 
+STREAM_RETRIES = 3
+
+# Бюджет хода на бэкенде; таймауты клиента — в clients.py
+REQUEST_TIMEOUT = 90
+
+
+def show_state(status, answer, data: ExtractData):
+    next_node = data.next_node
+    
+    if next_node == 'taro_node':
+        status.update(label=t('status_taro_node'), state='running')
+    elif next_node == 'taro_tool':
+        status.update(label=t('status_taro_tool'), state='running')
+    elif next_node == 'astro_node':
+        status.update(label=t('status_astro_node'), state='running')
+    elif next_node == 'img_node':
+        status.update(label=t('status_img_node'), state='running')
+    elif next_node == 'END':
+        status.update(label=t('status_end'), state='complete')
+    
+    # Ответ и расклад показываем, как только они появились в кадре, не дожидаясь END
+    if data.taro_cards and not st.session_state.get('cards'):
+        st.session_state.cards = data.taro_cards
+        st.session_state.unlock_name = data.unlock_name
+        
+        with answer['cards']:
+            st.session_state.spread_html = create_html_taro(data.taro_cards, data.unlock_name)
+    
+    if data.message_to_user and data.message_to_user != st.session_state.ai_msg:
+        st.session_state.ai_msg = data.message_to_user
+        answer['text'].markdown(data.message_to_user)
+
+
+start_rerun()
+
 if not st.user.is_logged_in:
     st.switch_page('login_menu.py')
     
 set_data()
+mark('set_data')
 
 col_1, col_2 = st.columns([5, 1])
 with col_2:
@@ -32,13 +72,38 @@ st.set_page_config(page_title=t('page_title_chat'), page_icon='🔮')
 st.title(t('chat_title'))
 
     
-for msg in st.session_state.messages:
-    avatar = st.session_state.user_avatar if msg['role'] == 'user' else st.session_state.bot_avatar
+# Рисуем только последние ходы, старые — по кнопке
+visible = st.session_state.messages[-st.session_state.history_window:]
+
+if len(visible) < len(st.session_state.messages) or st.session_state.history_cursor:
+    if st.button(t('load_older'), key='load_older'):
+        load_older_history()
+        st.rerun()
+
+# Миниатюра из общего кеша; пока она грузится, Streamlit рисует значок по умолчанию
+my_avatar = user_avatar()
+
+for index, msg in enumerate(visible):
+    avatar = my_avatar if msg['role'] == 'user' else st.session_state.bot_avatar
     with st.chat_message(msg['role'], avatar=avatar):
-        if msg.get('cards'):
-            create_html_taro(msg['cards'], msg['unlock_name'])    
+        if msg.get('html') or msg.get('cards'):
+            recent = index >= len(visible) - SPREAD_TURNS * 2
+            
+            if not recent and msg['key'] not in st.session_state.expanded_spreads:
+                # Вместо iframe старого расклада — лёгкая кнопка
+                if st.button(t('show_spread').format(msg['unlock_name']), key=f"spread-{msg['key']}"):
+                    st.session_state.expanded_spreads.add(msg['key'])
+                    st.rerun()
+            elif msg.get('cards'):
+                # По картам: ссылки на картинки берутся свежие, разметка — из кеша spread_html
+                create_html_taro([TaroCard.model_validate(card) for card in msg['cards']], msg['unlock_name'])
+            else:
+                # Старые сообщения без карт показываем как сохранены
+                show_html_taro(msg['html'], msg['unlock_name'])
         st.markdown(msg['content'])
         
+mark('history')
+
 with st.sidebar:
     st.title(t('sidebar_title'))
     
@@ -61,25 +126,42 @@ with st.sidebar:
     - [Telegram](https://t.me/eserov73)  
     - eserov73@gmail.com  
     """, unsafe_allow_html=True)
-    
+
+mark('sidebar')
     
 prompt = st.chat_input(t('chat_input'), key='chat_input', disabled=st.session_state.wait)
 
 if prompt:
-    st.session_state.messages.append({'role': 'user', 'content': prompt})
-    with st.chat_message("user", avatar=st.session_state.user_avatar):
+    # ID запроса переживает rerun-ы: повторная отправка подключится к тому же графу
+    st.session_state.request_id = str(uuid.uuid4())
+    st.session_state.prompt = prompt
+
+    st.session_state.messages.append({'key': str(uuid.uuid4()), 'role': 'user', 'content': prompt})
+    with st.chat_message("user", avatar=my_avatar):
         st.markdown(prompt)
-        add_message(st.user.sub, 'user', prompt)
+        save_message(st.user.sub, 'user', prompt)
         
     st.session_state.wait = True
     
         
 if st.session_state.wait:  
-    with st.status(t('think')) as status:
+    st.session_state.ai_msg = None
+    st.session_state.cards = None
+    st.session_state.spread_html = None
+    
+    status = st.status(t('think'))
+    
+    # Сообщение бота заполняется по мере прихода кадров
+    with st.chat_message('ai', avatar=st.session_state.bot_avatar):
+        answer = {'cards': st.container(), 'text': st.empty()}
+    
+    with status:
         # Асинхронный запрос к FastAPI с чтением потока
         request_data = {
-            "message": prompt, 
-            "user_id": str(st.user.sub), 
+            "message": st.session_state.prompt,
+            "user_id": str(st.user.sub),
+            "request_id": st.session_state.request_id,
+            "timeout": REQUEST_TIMEOUT,
             "country": st.session_state.country, 
             "time_birth": st.session_state.time_birth, 
             "birth_day": st.session_state.birth_day, 
@@ -87,39 +169,68 @@ if st.session_state.wait:
             "name": st.user.given_name
             }
         
-        with httpx.stream("POST", "http://127.0.0.1:8000/stream", json=request_data, timeout=None) as r:
-            for chunk in r.iter_text():
-                temp = json.loads(chunk)
-                data = ExtractData.model_validate(temp)
-                
-                next_node = data.next_node
-                
-                if next_node == 'taro_node':
-                    status.update(label=t('status_taro_node'), state='running')
-                elif next_node == 'taro_tool':
-                    status.update(label=t('status_taro_tool'), state='running')
-                elif next_node == 'astro_node':
-                    status.update(label=t('status_astro_node'), state='running')
-                elif next_node == 'img_node':
-                    status.update(label=t('status_img_node'), state='running')
-                elif next_node == 'END':
-                    status.update(label=t('status_end'), state='complete')
-                    
-                    st.session_state.ai_msg = data.message_to_user
-                    
-                    st.session_state.cards = data.taro_cards
-                    st.session_state.unlock_name = data.unlock_name
-                    
-                    st.session_state.messages.append({'role': 'ai', 'content': st.session_state.ai_msg, 'cards': st.session_state.cards, 'unlock_name': st.session_state.unlock_name})
+        # Номер последнего полученного события: после обрыва докачиваем с него,
+        # граф на бэкенде в это время продолжает работать
+        cursor = 0
+        # Ответ с ошибкой или битый кадр: ход не удался, даже если часть текста уже пришла
+        failed = False
+        
+        client = get_backend_client()
+        
+        for attempt in range(STREAM_RETRIES):
+            if attempt == 0:
+                stream = client.stream("POST", "/stream", json=request_data)
+            else:
+                stream = client.stream("GET", f"/stream/{st.session_state.request_id}", 
+                                       params={'user_id': str(st.user.sub), 'cursor': cursor})
+            
+            # Незаконченный кадр оборванного соединения придёт заново после курсора
+            decoder = NDJSONDecoder()
+            
+            try:
+                with stream as r:
+                    # 5xx, 404 на докачке (запуск уже забыт) — не поток событий, а ошибка
+                    r.raise_for_status()
+                    for chunk in r.iter_bytes():
+                        for frame in decoder.feed(chunk):
+                            data = ExtractData.model_validate(check_frame(frame))
+                            
+                            cursor = data.seq or cursor
+                            show_state(status, answer, data)
+                    for frame in decoder.close():
+                        show_state(status, answer, ExtractData.model_validate(check_frame(frame)))
+                break
+            except httpx.TransportError as e:
+                print(f"Stream interrupted after event {cursor}, reconnecting: {e}")
+            except (httpx.HTTPStatusError, ValueError, RunFailed) as e:
+                # ValueError — и невалидный JSON, и ValidationError кадра; RunFailed — граф упал
+                print(f"Stream failed after event {cursor}: {e}")
+                failed = True
+                break
+        else:
+            # Все попытки ушли на обрывы соединения
+            failed = True
     
-    with st.chat_message('ai', avatar=st.session_state.bot_avatar):
-        if st.session_state.get('cards'):
-            html_code = create_html_taro(st.session_state.cards, 
-                            st.session_state.unlock_name)
-        add_message(st.user.sub, 'bot', st.session_state.ai_msg)
-        st.write_stream(stream_text(st.session_state.ai_msg))
+    if failed or not st.session_state.ai_msg:
+        # Сбой видно только в этой сессии: в БД и в историю он как ответ бота не попадает
+        answer['text'].markdown(t('stream_error'))
+        st.session_state.messages.append({'key': str(uuid.uuid4()), 'role': 'ai', 'content': t('stream_error'), 'cards': None, 'unlock_name': None, 'html': None})
+    else:
+        html_code, cards, spread = st.session_state.spread_html, None, None
+        if st.session_state.cards:
+            cards = [card.model_dump() for card in st.session_state.cards]
+            spread = st.session_state.unlock_name
+        
+        st.session_state.messages.append({'key': str(uuid.uuid4()), 'role': 'ai', 'content': st.session_state.ai_msg, 'cards': cards, 'unlock_name': spread, 'html': html_code})
+        # Расклад сохраняется целиком: история покажет его без повторного запроса к LLM
+        save_message(st.user.sub, 'bot', st.session_state.ai_msg, html=html_code, cards=cards, spread=spread)
         
     st.session_state.cards = None
     st.session_state.wait = False
+    trim_history()
     
-    st.rerun()
\ No newline at end of file
+    mark('turn')
+    finish_rerun('app')
+    st.rerun()
+
+finish_rerun('app')
@@ -5,7 +5,7 @@ from database.request import add_user, update_user
 
 from locales import t
 
-from utils import create_user_zep
+from utils import create_user_zep, profile_saved
 
 today = date.today()
 thirteen_years_ago = today.replace(year=today.year - 13)
@@ -84,9 +84,12 @@ with st.container(border=True, horizontal_alignment="center", vertical_alignment
                 city = None
             if city:
                 try:
-                    add_user(str(st.user.sub), st.session_state.birth_day.strftime("%d.%m.%Y"), st.session_state.time_birth.strftime("%H:%M"), city, country, st.session_state.lang)
-                except:
-                    update_user(str(st.user.sub), st.session_state.birth_day.strftime("%d.%m.%Y"), st.session_state.time_birth.strftime("%H:%M"), city, country, st.session_state.lang)
+                    try:
+                        user = add_user(str(st.user.sub), st.session_state.birth_day.strftime("%d.%m.%Y"), st.session_state.time_birth.strftime("%H:%M"), city, country, st.session_state.lang)
+                    except:
+                        user = update_user(str(st.user.sub), st.session_state.birth_day.strftime("%d.%m.%Y"), st.session_state.time_birth.strftime("%H:%M"), city, country, st.session_state.lang)
+                    # Один запрос на сохранение, какая бы из веток ни сработала
+                    profile_saved(user)
                 finally:
                     create_user_zep()
                     st.switch_page('pages/app.py')
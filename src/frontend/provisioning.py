@@ -0,0 +1,197 @@
+import argparse
+import heapq
+import itertools
+import os
+import threading
+import time
+
+from dataclasses import dataclass
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from database.request import is_zep_provisioned, mark_zep_provisioned, get_unprovisioned_users
+
+load_dotenv()
+
+zep_api = os.getenv('ZEP_API')
+
+# Сколько раз пробуем завести пользователя, прежде чем оставить его догоняющей загрузке
+ZEP_PROVISION_ATTEMPTS = int(os.getenv('ZEP_PROVISION_ATTEMPTS', '6'))
+# Задержка перед повтором: base * 2^попытка, но не больше max
+ZEP_PROVISION_BACKOFF = float(os.getenv('ZEP_PROVISION_BACKOFF', '1'))
+ZEP_PROVISION_MAX_BACKOFF = float(os.getenv('ZEP_PROVISION_MAX_BACKOFF', '60'))
+
+
+# Клиент Zep и очередь — объекты процесса: ими пользуются фоновый поток и CLI, где нет Streamlit
+_lock = threading.Lock()
+_zep = None
+_provisioner = None
+
+
+def get_zep():
+    global _zep
+    with _lock:
+        if _zep is None:
+            # Клиент нужен только фоновому потоку — не грузим zep_cloud на каждой странице
+            from zep_cloud.client import Zep
+            _zep = Zep(api_key=zep_api)
+        return _zep
+
+
+def create_or_exists(create, get):
+    # Синхронный вариант graph.nodes._create_or_exists на бэкенде
+    from zep_cloud.core.api_error import ApiError
+    from zep_cloud.errors import NotFoundError
+
+    try:
+        create()
+    except ApiError as e:
+        if e.status_code not in (400, 409):
+            raise
+        try:
+            get()
+        except NotFoundError:
+            raise e
+
+
+@dataclass(slots=True)
+class ProvisionJob:
+    user_id: str
+    first_name: Optional[str] = None
+    email: Optional[str] = None
+    attempt: int = 0
+
+
+class ZepProvisioner:
+    """Фоновое заведение пользователей и их тредов в Zep.
+
+    Страница регистрации только ставит задачу в очередь процесса и сразу
+    идёт дальше. Поток проверяет отметку `zep_provisioned_at` в Postgres,
+    вызывает Zep и ставит отметку, поэтому вернувшийся пользователь не
+    стоит ни одного запроса к Zep. Упавшая задача повторяется с
+    экспоненциальной задержкой; кого не удалось завести за `max_attempts`
+    (или кто потерялся при остановке процесса), подберёт `backfill`.
+    """
+
+    def __init__(self, max_attempts: int, backoff: float, max_backoff: float):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        # (когда выполнить, порядковый номер, задача)
+        self._jobs = []
+        self._order = itertools.count()
+        self._ready = threading.Condition()
+        # Кто уже в очереди или заведён — повторные submit ничего не стоят
+        self._queued = set()
+        self._provisioned = set()
+
+        self.done = 0
+        self.failed = 0
+
+        self._thread = threading.Thread(target=self._run, name='zep-provisioner', daemon=True)
+        self._thread.start()
+
+    def submit(self, user_id: str, first_name: str | None = None, email: str | None = None) -> bool:
+        """Ставит пользователя в очередь; False — он уже в очереди или заведён."""
+        with self._ready:
+            if user_id in self._queued or user_id in self._provisioned:
+                return False
+            self._queued.add(user_id)
+            self._push(ProvisionJob(user_id, first_name, email), 0)
+            return True
+
+    def backfill(self, limit: int | None = None) -> int:
+        """Ставит в очередь всех пользователей из БД без отметки; возвращает их число."""
+        return sum(self.submit(user_id) for user_id in get_unprovisioned_users(limit))
+
+    def wait_idle(self, poll: float = 1.0):
+        # Для CLI: ждём, пока все задачи завершатся или исчерпают попытки
+        while True:
+            with self._ready:
+                if not self._queued:
+                    return
+            time.sleep(poll)
+
+    def _push(self, job: ProvisionJob, delay: float):
+        heapq.heappush(self._jobs, (time.monotonic() + delay, next(self._order), job))
+        self._ready.notify()
+
+    def _next(self) -> ProvisionJob:
+        with self._ready:
+            while True:
+                if self._jobs:
+                    wait = self._jobs[0][0] - time.monotonic()
+                    if wait <= 0:
+                        return heapq.heappop(self._jobs)[2]
+                    self._ready.wait(wait)
+                else:
+                    self._ready.wait()
+
+    def _run(self):
+        while True:
+            job = self._next()
+            try:
+                self._provision(job)
+            except Exception as e:
+                job.attempt += 1
+                if job.attempt < self.max_attempts:
+                    delay = min(self.max_backoff, self.backoff * 2 ** job.attempt)
+                    print(f"Zep provisioning for {job.user_id} failed, retry in {delay:.0f}s: {e!r}")
+                    with self._ready:
+                        self._push(job, delay)
+                    continue
+
+                self.failed += 1
+                print(f"Zep provisioning for {job.user_id} gave up after {job.attempt} attempts: {e!r}")
+            else:
+                self.done += 1
+                with self._ready:
+                    self._provisioned.add(job.user_id)
+
+            with self._ready:
+                self._queued.discard(job.user_id)
+
+    def _provision(self, job: ProvisionJob):
+        if is_zep_provisioned(job.user_id):
+            return
+
+        zep = get_zep()
+        create_or_exists(
+            lambda: zep.user.add(user_id=job.user_id, first_name=job.first_name, email=job.email),
+            lambda: zep.user.get(job.user_id),
+        )
+        # Тред мог завести и бэкенд, если первый ход обогнал эту задачу
+        create_or_exists(
+            lambda: zep.thread.create(thread_id=job.user_id, user_id=job.user_id),
+            lambda: zep.thread.get(job.user_id, limit=1),
+        )
+
+        mark_zep_provisioned(job.user_id)
+
+    def stats(self) -> dict:
+        with self._ready:
+            return {'pending': len(self._jobs), 'done': self.done, 'failed': self.failed}
+
+
+def get_provisioner() -> ZepProvisioner:
+    global _provisioner
+    with _lock:
+        if _provisioner is None:
+            _provisioner = ZepProvisioner(ZEP_PROVISION_ATTEMPTS, ZEP_PROVISION_BACKOFF, ZEP_PROVISION_MAX_BACKOFF)
+        return _provisioner
+
+
+# Догоняющая загрузка: python provisioning.py --backfill
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Заводит в Zep пользователей без отметки zep_provisioned_at')
+    parser.add_argument('--backfill', action='store_true')
+    parser.add_argument('--limit', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.backfill:
+        provisioner = get_provisioner()
+        print(f"Queued {provisioner.backfill(args.limit)} users")
+        provisioner.wait_idle()
+        print(f"Provisioned {provisioner.done}, failed {provisioner.failed}")
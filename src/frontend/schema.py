@@ -11,6 +11,10 @@ class ExtractData(BaseModel):
     next_node: Optional[Literal['astro_node', 'taro_node', 'astro_tool', 'taro_tool', 'router_node','img_node', 'add_memory', 'END']] = 'router_node'
     
     unlock_name: Optional[str] = None
+    tier: Optional[Literal['full', 'reduced', 'minimal']] = None
+    
+    seq: Optional[int] = None
+    run_id: Optional[str] = None
     
     class Config:
         extra = "ignore"
\ No newline at end of file
@@ -0,0 +1,44 @@
+try:
+    # orjson заметно быстрее на частых мелких кадрах, но необязателен
+    import orjson
+
+    def loads(data: bytes):
+        return orjson.loads(data)
+except ImportError:
+    import json
+
+    def loads(data: bytes):
+        return json.loads(data)
+
+
+class RunFailed(Exception):
+    """Последний кадр потока — ошибка графа: ход не удался."""
+
+
+def check_frame(frame: dict) -> dict:
+    # Терминальный кадр ошибки от /stream: {"run_id": ..., "error": ...}
+    if 'error' in frame:
+        raise RunFailed(frame['error'])
+    return frame
+
+
+class NDJSONDecoder:
+    """Инкрементальный разбор потока /stream (по JSON-объекту на строку).
+
+    Куски транспорта не совпадают с кадрами: под нагрузкой несколько
+    кадров приходят одним куском, а кадр может разорваться посередине
+    (в том числе посреди UTF-8 символа). Поэтому копим байты и отдаём
+    только строки, закрытые переводом строки.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+
+    def feed(self, chunk: bytes) -> list:
+        *frames, self._buffer = (self._buffer + chunk).split(b'\n')
+        return [loads(frame) for frame in frames if frame.strip()]
+
+    def close(self) -> list:
+        # Хвост без перевода строки — последний кадр, если он целый
+        frame, self._buffer = self._buffer, b''
+        return [loads(frame)] if frame.strip() else []
@@ -0,0 +1,47 @@
+import os
+import statistics
+import time
+
+from collections import defaultdict, deque
+
+import streamlit as st
+
+# RERUN_TIMINGS=1 — печатать время каждого перезапуска страницы
+RERUN_TIMINGS = os.getenv('RERUN_TIMINGS', '').lower() in ('1', 'true', 'yes')
+
+
+@st.cache_resource
+def _history():
+    # Последние замеры по страницам, общие для всех сессий процесса
+    return defaultdict(lambda: deque(maxlen=200))
+
+
+def start_rerun():
+    now = time.perf_counter()
+    # (начало, последняя отметка, длительности этапов)
+    st.session_state._rerun_timing = [now, now, {}]
+
+
+def mark(stage: str):
+    # Этап — всё, что выполнилось после предыдущей отметки
+    timing = st.session_state.get('_rerun_timing')
+    if timing:
+        now = time.perf_counter()
+        timing[2][stage] = (now - timing[1]) * 1000
+        timing[1] = now
+
+
+def finish_rerun(page: str):
+    """Записывает время перезапуска страницы; st.rerun()/switch_page до этого места не учитываются."""
+    timing = st.session_state.pop('_rerun_timing', None)
+    if timing is None:
+        return
+
+    started, _, stages = timing
+    total = (time.perf_counter() - started) * 1000
+    history = _history()[page]
+    history.append(total)
+
+    if RERUN_TIMINGS:
+        details = ', '.join(f'{stage} {ms:.1f}' for stage, ms in stages.items())
+        print(f"⏱ {page}: {total:.1f} ms (p50 {statistics.median(history):.1f} ms over {len(history)}) [{details}]")
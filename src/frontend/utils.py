@@ -1,23 +1,27 @@
 import streamlit as st
 import time
-import httpx
 from datetime import date, time as dtime
 from check_city import get_info_from_city
-from database.request import get_last_messages, get_user, update_user, add_user
+from database.request import get_history, get_user, update_user, add_user, flush_messages, to_chat_message
 
 from datetime import datetime
 
 from locales import t
+from avatars import user_avatar
+from provisioning import get_provisioner
+from clients import warm_session, precompute_chart
 
-from zep_cloud.client import Zep
 from dotenv import load_dotenv
 import os
 
 load_dotenv()
 
-zep_api = os.getenv('ZEP_API')
-
-zep = Zep(api_key=zep_api)
+# Сколько последних ходов (вопрос + ответ) чата показывается сразу
+CHAT_TURNS = int(os.getenv('CHAT_TURNS', '5'))
+# Расклады в стольких последних ходах рисуются сразу, старше — по кнопке
+SPREAD_TURNS = 2
+# Сколько сообщений держим в st.session_state, прежде чем перечитать хвост из БД
+MAX_SESSION_MESSAGES = 60
 
 today = date.today()
 thirteen_years_ago = today.replace(year=today.year - 13)
@@ -44,15 +48,42 @@ def stream_text(text, delay=0.01):
         time.sleep(delay)
 
 
+def load_recent_history(user_id):
+    # Последняя страница истории; старше — по кнопке через курсор.
+    # Сначала дописываем отложенные сообщения, иначе последние ходы пропадут и из страницы, и из курсора
+    flush_messages()
+    page = get_history(user_id, CHAT_TURNS * 2)
+    
+    st.session_state.messages = [to_chat_message(msg) for msg in page.messages]
+    st.session_state.history_cursor = page.older
+    st.session_state.history_window = CHAT_TURNS * 2
+    st.session_state.expanded_spreads = set()
+
+
+def load_older_history():
+    # Сначала показываем то, что уже есть в сессии, недостающее догружаем из БД
+    st.session_state.history_window += CHAT_TURNS * 2
+    missing = st.session_state.history_window - len(st.session_state.messages)
+    
+    if missing > 0 and st.session_state.history_cursor:
+        flush_messages()
+        page = get_history(str(st.user.sub), missing, st.session_state.history_cursor)
+        st.session_state.messages[:0] = [to_chat_message(msg) for msg in page.messages]
+        st.session_state.history_cursor = page.older
+
+
+def trim_history():
+    # Длинная сессия: перечитываем из БД только хвост, чтобы session_state не рос
+    if len(st.session_state.messages) > MAX_SESSION_MESSAGES:
+        load_recent_history(str(st.user.sub))
+
+
 def set_data():
     user_id = str(st.user.sub)
     print(f"🔍 set_data() вызвана для пользователя: {user_id}")
     
     if "messages" not in st.session_state:
-        try:
-            st.session_state.messages = get_last_messages(user_id, 6)
-        except:
-            st.session_state.messages = []
+        load_recent_history(user_id)
             
     if 'city' not in st.session_state or 'country' not in st.session_state:
         try:
@@ -77,19 +108,19 @@ def set_data():
         except Exception as e:
             print(f"Error loading user info: {e}")
 
+    if "warmed" not in st.session_state:
+        # Раз на сессию: первый ход не платит за холодные кеши бэкенда
+        st.session_state.warmed = True
+        warm_session(user_id, st.session_state.get('birth_day'), st.session_state.get('time_birth'), st.session_state.get('city'), st.session_state.get('country'))
+
     if "wait" not in st.session_state:
         st.session_state.wait = False
 
     if "ai_msg" not in st.session_state:
         st.session_state.ai_msg = ""
 
-    if "user_avatar" not in st.session_state and hasattr(st, "user") and st.user.picture:
-        try:
-            user_avatar_url = st.user.picture
-            r = httpx.get(user_avatar_url)
-            st.session_state.user_avatar = r.content
-        except Exception as e:
-            print(f"Error loading avatar: {e}")
+    # Аватар живёт в общем кеше процесса; здесь только запускаем загрузку, не дожидаясь её
+    user_avatar()
 
     if "bot_avatar" not in st.session_state:
         st.session_state.bot_avatar = "images/bot_avatar.png"
@@ -125,23 +156,17 @@ def create_form_with_info():
                 st.success(t('new_data'))
                 
                 try:
-                    update_user(str(st.user.sub), st.session_state.birth_day, st.session_state.time_birth, st.session_state.city, st.session_state.country)
+                    user = update_user(str(st.user.sub), st.session_state.birth_day, st.session_state.time_birth, st.session_state.city, st.session_state.country)
                 except Exception as e:
-                    add_user(str(st.user.sub), st.session_state.birth_day, st.session_state.time_birth, st.session_state.city, st.session_state.country)
+                    user = add_user(str(st.user.sub), st.session_state.birth_day, st.session_state.time_birth, st.session_state.city, st.session_state.country)
+                profile_saved(user)
             else:
                 st.warning(t('fields_warning'))
                 
+def profile_saved(user):
+    # Сводка натальной карты считается на бэкенде заранее, а не в ходе чата
+    precompute_chart(user.user_id, user.birth_date, user.birth_time, user.city, user.country)
+                
 def create_user_zep():
-    try:
-        zep.user.add(
-            user_id=str(st.user.sub),
-            first_name=st.user.given_name,
-            email=st.user.email,
-        )
-        
-        zep.thread.create(
-            thread_id=str(st.user.sub),
-            user_id=str(st.user.sub)
-        )
-    except:
-        print(f'User_id {str(st.user.sub)} already exist')
\ No newline at end of file
+    # Zep заводится в фоне; регистрация его не ждёт, повторный вызов ничего не стоит
+    get_provisioner().submit(str(st.user.sub), st.user.get('given_name'), st.user.get('email'))
\ No newline at end of file